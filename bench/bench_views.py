@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+"""
+Times how long the SublimeGDB views take to render large amounts of
+data, without Sublime Text. The sublime module is replaced with the
+in-memory one next to this file.
+
+    python bench/bench_views.py
+    python bench/bench_views.py --scale 4 --json results.json
+    python bench/bench_views.py --compare results.json --tolerance 25
+
+With --compare the run fails if any benchmark got more than tolerance
+percent slower than in the given results, so that it can be run in CI.
+"""
+import gc
+import json
+import optparse
+import os
+import random
+import resource
+import sys
+import time
+import traceback
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(bench_dir))
+sys.path.insert(0, bench_dir)
+
+import sublime
+import sublimegdb
+
+
+def make_variable(name, exp, children=0, depth=0, parent=None):
+    vp = {
+        "name": name,
+        "exp": exp,
+        "numchild": str(children),
+        "type": "std::vector<int>" if children > 0 else "int",
+        "value": "{...}" if children > 0 else str(len(name) * 7),
+    }
+    var = sublimegdb.GDBVariable(vp, parent)
+    if children > 0 and depth > 0:
+        for i in range(children):
+            var.children.append(make_variable("%s.%d" % (name, i), str(i),
+                                              children if depth > 1 else 0, depth - 1, var))
+        var.is_expanded = True
+    return var
+
+
+def make_variables(count, children, depth):
+    variables = []
+    for i in range(count):
+        var = make_variable("var%d" % i, "local%d" % i, children, depth)
+        # Every fifth one changed since the last stop
+        if i % 5 == 0:
+            var["value"] = var["value"]
+        variables.append(var)
+    return variables
+
+
+def make_registers(count):
+    registers = []
+    for i in range(count):
+        if i % 8 == 7:
+            val = "{v4_float = {0x0, 0x1, 0x2, 0x3}, v2_double = {0x0, 0x1}}"
+        else:
+            val = "0x%x" % ((i * 0x9e3779b97f4a7c15) & (0xffffffffffffffff if i % 2 else 0xffffffff))
+        registers.append(sublimegdb.GDBRegister("r%d" % i, i, val))
+    return registers
+
+
+def make_frames(count):
+    frames = []
+    for i in range(count):
+        args = [
+            {"name": "this", "value": "0x%x" % (0x600000 + i)},
+            {"name": "self", "value": "{a = %d, b = {c = 1, d = 2}}" % i},
+            {"name": "count", "value": str(i)},
+        ]
+        frames.append(sublimegdb.GDBCallstackFrame("func_%d" % i, args, "0x%016x" % (0x400000 + i * 16),
+                                                   "/src/file%d.cpp" % (i % 50), i % 1000))
+    return frames
+
+
+def make_threads(count):
+    return [sublimegdb.GDBThread(i + 1, "stopped", "func_%d (args=...)" % (i % 40), "i1") for i in range(count)]
+
+
+def open_view(view):
+    view.open()
+    sublime.run_timeouts()
+    return view
+
+
+def bench_variables_format(scale):
+    variables = make_variables(200 * scale, 10, 2)
+
+    def run():
+        line = 0
+        size = 0
+        dirty = []
+        for var in variables:
+            output, line = var.format(line=line, dirty=dirty)
+            size += len(output)
+        return size
+    return run
+
+
+def bench_variables_view(scale):
+    view = open_view(sublimegdb.gdb_variables_view)
+    view.variables = make_variables(50 * scale, 10, 2)
+
+    def run():
+        view.update_view()
+        sublime.run_timeouts()
+        return view.get_view().size()
+    return run
+
+
+def bench_registers_format(scale):
+    registers = make_registers(256 * scale)
+
+    def run():
+        line = 0
+        size = 0
+        for reg in registers:
+            output, line = reg.format(line)
+            size += len(output)
+        return size
+    return run
+
+
+def bench_callstack_format(scale):
+    frames = make_frames(2000 * scale)
+
+    def run():
+        return sum([len(frame.format()) for frame in frames])
+    return run
+
+
+def bench_threads_format(scale):
+    threads = make_threads(5000 * scale)
+
+    def run():
+        return len("".join([thread.format() for thread in threads]))
+    return run
+
+
+def bench_view_add_line(scale):
+    view = open_view(sublimegdb.GDBView("Bench Add Line"))
+    lines = ["line %d of the console output\n" % i for i in range(2000 * scale)]
+
+    def run():
+        view.clear()
+        for line in lines:
+            view.add_line(line)
+        sublime.run_timeouts()
+        return view.get_view().size()
+    return run
+
+
+def bench_view_replace_lines(scale):
+    view = open_view(sublimegdb.GDBView("Bench Replace Lines"))
+    count = 5000 * scale
+    view.add_line("".join(["row %d\n" % i for i in range(count)]), True)
+    rows = random.Random(1).sample(range(count), count / 10)
+
+    def run():
+        for row in rows:
+            view.replace_lines(row, row + 1, "changed row %d\n" % row)
+        sublime.run_timeouts()
+        return view.get_view().size()
+    return run
+
+
+benchmarks = [
+    ("variables_format", bench_variables_format),
+    ("variables_view", bench_variables_view),
+    ("registers_format", bench_registers_format),
+    ("callstack_format", bench_callstack_format),
+    ("threads_format", bench_threads_format),
+    ("view_add_line", bench_view_add_line),
+    ("view_replace_lines", bench_view_replace_lines),
+]
+
+
+def peak_rss():
+    # Kilobytes on Linux, bytes on OS X
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024
+    return rss
+
+
+def measure(name, setup, scale, repeat):
+    gc.collect()
+    before = peak_rss()
+    run = setup(scale)
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        size = run()
+        times.append((time.time() - start) * 1000)
+    return {
+        "name": name,
+        "min_ms": min(times),
+        "avg_ms": sum(times) / len(times),
+        "size": size,
+        "rss_growth_kb": peak_rss() - before,
+    }
+
+
+def measure_apart(name, setup, scale, repeat):
+    # Peak memory only ever grows, so every benchmark is run in a
+    # process of its own to not be measured against the ones before it
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            os.write(w, json.dumps(measure(name, setup, scale, repeat)))
+        except:
+            traceback.print_exc()
+        finally:
+            os._exit(0)
+    os.close(w)
+    data = ""
+    while True:
+        chunk = os.read(r, 4096)
+        if len(chunk) == 0:
+            break
+        data += chunk
+    os.close(r)
+    os.waitpid(pid, 0)
+    if len(data) == 0:
+        raise RuntimeError("benchmark %s failed" % name)
+    return json.loads(data)
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] [benchmark...]")
+    parser.add_option("--scale", type="int", default=1, help="multiplies the amount of data rendered")
+    parser.add_option("--repeat", type="int", default=5, help="runs of each benchmark, the fastest one counts")
+    parser.add_option("--json", help="write the results to this file")
+    parser.add_option("--compare", help="fail if slower than the results in this file")
+    parser.add_option("--tolerance", type="float", default=25, help="percent slower allowed with --compare")
+    options, names = parser.parse_args()
+
+    for name in names:
+        if name not in [b[0] for b in benchmarks]:
+            parser.error("no benchmark called %s" % name)
+
+    results = []
+    print "%-20s %10s %10s %12s %12s" % ("benchmark", "min ms", "avg ms", "size", "rss +kB")
+    for name, setup in benchmarks:
+        if len(names) > 0 and name not in names:
+            continue
+        r = measure_apart(name, setup, options.scale, options.repeat)
+        results.append(r)
+        print "%-20s %10.2f %10.2f %12d %12d" % (name, r["min_ms"], r["avg_ms"], r["size"], r["rss_growth_kb"])
+
+    if options.json:
+        f = open(options.json, "w")
+        try:
+            json.dump({"scale": options.scale, "results": results}, f, indent=4)
+        finally:
+            f.close()
+
+    if options.compare:
+        f = open(options.compare)
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        if baseline.get("scale", 1) != options.scale:
+            print "%s was run with --scale %d" % (options.compare, baseline["scale"])
+            return 2
+        old = dict([(r["name"], r) for r in baseline["results"]])
+        failed = False
+        for r in results:
+            if r["name"] not in old:
+                continue
+            limit = old[r["name"]]["min_ms"] * (1 + options.tolerance / 100.0)
+            if r["min_ms"] > limit:
+                print "%s got slower: %.2f ms, was %.2f ms" % (r["name"], r["min_ms"], old[r["name"]]["min_ms"])
+                failed = True
+        if failed:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+"""
+Just enough of Sublime Text 2's sublime module for the views in
+sublimegdb.py to render into memory, so that they can be timed
+without the editor.
+"""
+import bisect
+import re
+
+HIDDEN = 1
+DRAW_OUTLINED = 2
+ENCODED_POSITION = 1
+TRANSIENT = 4
+
+timeouts = []
+newline_regex = re.compile("\n")
+
+
+class Region(object):
+    def __init__(self, a, b=None):
+        if b == None:
+            b = a
+        self.a = a
+        self.b = b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and self.a == other.a and self.b == other.b
+
+    def __repr__(self):
+        return "(%d, %d)" % (self.a, self.b)
+
+
+class RegionSet(list):
+    def add(self, region):
+        self.append(region)
+
+
+class Settings(object):
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.callbacks = {}
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def has(self, key):
+        return key in self.values
+
+    def set(self, key, value):
+        self.values[key] = value
+        for callback in self.callbacks.values():
+            callback()
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+    def add_on_change(self, key, callback):
+        self.callbacks[key] = callback
+
+    def clear_on_change(self, key):
+        self.callbacks.pop(key, None)
+
+
+class Edit(object):
+    pass
+
+
+class View(object):
+    next_id = 1
+
+    def __init__(self, window=None):
+        self.view_id = View.next_id
+        View.next_id += 1
+        self.parent = window
+        self.text = ""
+        # Offsets of the first character of every line, built lazily and
+        # then kept up to date by modify()
+        self.starts = None
+        self.name_ = ""
+        self.read_only = False
+        self.scratch = False
+        self.syntax = None
+        self.view_settings = Settings()
+        self.regions = {}
+        self.selection = RegionSet([Region(0)])
+        self.status = {}
+        self.edits = 0
+        self.viewport = (0, 0)
+
+    def id(self):
+        return self.view_id
+
+    def window(self):
+        return self.parent
+
+    def file_name(self):
+        return None
+
+    def name(self):
+        return self.name_
+
+    def set_name(self, name):
+        self.name_ = name
+
+    def set_scratch(self, scratch):
+        self.scratch = scratch
+
+    def set_read_only(self, read_only):
+        self.read_only = read_only
+
+    def is_read_only(self):
+        return self.read_only
+
+    def set_syntax_file(self, syntax):
+        self.syntax = syntax
+
+    def settings(self):
+        return self.view_settings
+
+    def begin_edit(self, *args):
+        return Edit()
+
+    def end_edit(self, edit):
+        self.edits += 1
+
+    def size(self):
+        return len(self.text)
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self.text[x.begin():x.end()]
+        return self.text[x:x + 1]
+
+    def modify(self, begin, end, text):
+        if self.read_only:
+            raise ValueError("view %s is read only" % self.name_)
+        self.text = self.text[:begin] + text + self.text[end:]
+        if self.starts == None:
+            return
+        # Only the lines in the edited range change, the ones after it
+        # just move, so that an edit doesn't rescan the whole text
+        lo = bisect.bisect_right(self.starts, begin)
+        hi = bisect.bisect_right(self.starts, end)
+        delta = len(text) - (end - begin)
+        added = [begin + m.end() for m in newline_regex.finditer(text)]
+        self.starts[lo:] = added + [start + delta for start in self.starts[hi:]]
+
+    def insert(self, edit, point, text):
+        self.modify(point, point, text)
+        return len(text)
+
+    def erase(self, edit, region):
+        self.modify(region.begin(), region.end(), "")
+
+    def replace(self, edit, region, text):
+        self.modify(region.begin(), region.end(), text)
+
+    def line_starts(self):
+        if self.starts == None:
+            self.starts = [0] + [m.end() for m in newline_regex.finditer(self.text)]
+        return self.starts
+
+    def text_point(self, row, col):
+        starts = self.line_starts()
+        if row >= len(starts):
+            return len(self.text)
+        return min(starts[row] + col, len(self.text))
+
+    def rowcol(self, point):
+        starts = self.line_starts()
+        row = bisect.bisect_right(starts, point) - 1
+        return (row, point - starts[row])
+
+    def line(self, x):
+        if isinstance(x, Region):
+            begin, end = x.begin(), x.end()
+        else:
+            begin = end = x
+        row = self.rowcol(begin)[0]
+        start = self.line_starts()[row]
+        stop = self.text.find("\n", end)
+        if stop == -1:
+            stop = len(self.text)
+        return Region(start, stop)
+
+    def full_line(self, x):
+        region = self.line(x)
+        return Region(region.a, min(region.b + 1, len(self.text)))
+
+    def lines(self, region):
+        lines = []
+        row = self.rowcol(region.begin())[0]
+        last = self.rowcol(region.end())[0]
+        while row <= last:
+            lines.append(self.line(self.text_point(row, 0)))
+            row += 1
+        return lines
+
+    def word(self, x):
+        return self.line(x)
+
+    def sel(self):
+        return self.selection
+
+    def show(self, x, *args):
+        pass
+
+    def show_at_center(self, x):
+        pass
+
+    def visible_region(self):
+        return Region(0, len(self.text))
+
+    def viewport_position(self):
+        return self.viewport
+
+    def set_viewport_position(self, pos, animate=True):
+        self.viewport = pos
+
+    def viewport_extent(self):
+        return (800, 600)
+
+    def line_height(self):
+        return 16
+
+    def add_regions(self, key, regions, scope="", icon="", flags=0):
+        self.regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return self.regions.get(key, [])
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+    def set_status(self, key, value):
+        self.status[key] = value
+
+    def get_status(self, key):
+        return self.status.get(key, "")
+
+    def erase_status(self, key):
+        self.status.pop(key, None)
+
+    def run_command(self, cmd, args=None):
+        pass
+
+    def fold(self, regions):
+        pass
+
+    def unfold(self, regions):
+        pass
+
+    def is_loading(self):
+        return False
+
+    def is_dirty(self):
+        return False
+
+    def set_fold_region(self, region):
+        pass
+
+
+class Window(object):
+    def __init__(self):
+        self.window_views = []
+        self.active = None
+        self.group = 0
+
+    def id(self):
+        return 1
+
+    def new_file(self):
+        view = View(self)
+        self.window_views.append(view)
+        self.active = view
+        return view
+
+    def open_file(self, path, flags=0):
+        return self.new_file()
+
+    def views(self):
+        return list(self.window_views)
+
+    def active_view(self):
+        return self.active
+
+    def active_view_in_group(self, group):
+        return self.active
+
+    def get_view_index(self, view):
+        return (0, self.window_views.index(view))
+
+    def focus_view(self, view):
+        self.active = view
+
+    def focus_group(self, group):
+        self.group = group
+
+    def active_group(self):
+        return self.group
+
+    def num_groups(self):
+        return 1
+
+    def folders(self):
+        return []
+
+    def run_command(self, cmd, args=None):
+        if cmd == "close" and self.active in self.window_views:
+            self.window_views.remove(self.active)
+            self.active.parent = None
+            self.active = self.window_views[-1] if len(self.window_views) > 0 else None
+
+    def show_input_panel(self, caption, initial, on_done, on_change, on_cancel):
+        return View(self)
+
+    def show_quick_panel(self, items, on_done, flags=0):
+        pass
+
+
+# Never debug logging, the benchmarks would mostly be timing the log file
+plugin_settings = Settings({"debug": False})
+window = Window()
+
+
+def active_window():
+    return window
+
+
+def windows():
+    return [window]
+
+
+def load_settings(name):
+    return plugin_settings
+
+
+def save_settings(name):
+    pass
+
+
+def packages_path():
+    return "/tmp"
+
+
+def set_timeout(callback, delay):
+    # Run from run_timeouts() instead, in the order they were scheduled
+    # like the editor's main thread would
+    timeouts.append(callback)
+
+
+def run_timeouts():
+    while len(timeouts) > 0:
+        pending = timeouts[:]
+        del timeouts[:]
+        for callback in pending:
+            callback()
+
+
+def status_message(msg):
+    pass
+
+
+def error_message(msg):
+    pass
+
+
+def message_dialog(msg):
+    pass
+
+
+def ok_cancel_dialog(msg, ok_title=""):
+    return True
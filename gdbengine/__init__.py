@@ -0,0 +1,8 @@
+"""
+The gdb/MI side of SublimeGDB, usable without Sublime Text: starting
+gdb, sending commands, reading and parsing what it prints, and
+recording and replaying transcripts of sessions.
+"""
+from resultparser import parse_result_line
+from session import GDBSession, get_result
+from transcript import TranscriptRecorder, TranscriptReplay
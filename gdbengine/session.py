@@ -0,0 +1,257 @@
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+import traceback
+import resultparser
+from transcript import TranscriptRecorder, TranscriptReplay
+
+result_regex = re.compile("(?<=\^)[^,\"]*")
+command_result_regex = re.compile("^(\d+)\^")
+run_status_regex = re.compile("(^\d*\*)([^,]+)")
+
+
+def get_result(line):
+    return result_regex.search(line).group(0)
+
+
+def unescape_stream(line):
+    return line[2:-1].replace("\\n", "\n").replace("\\\"", "\"").replace("\\t", "\t")
+
+
+class GDBSession:
+    # Owns one gdb process talking MI. Commands are given increasing
+    # tokens and their results are either waited for, handed to a
+    # callback or ignored. Everything else gdb prints is reported to
+    # the listeners added with on():
+    #
+    #   command(token, cmd)  a command was given a token
+    #   write(text)          text is about to be sent to gdb
+    #   line(line)           any line gdb printed
+    #   notify(cls, res)     =thread-created and other notifications
+    #   status(status, line) *running and *stopped records
+    #   result(token, line)  the result of a command
+    #   console(text)        ~ console stream output
+    #   target(text)         output of the program being debugged
+    #   exit()               gdb has exited
+    #
+    # Listeners and result callbacks are called on the thread reading
+    # gdb's output, unless dispatch is given a function that queues
+    # them somewhere else.
+    def __init__(self, parse=None, dispatch=None):
+        self.parse = parse or resultparser.parse_result_line
+        self.dispatch = dispatch or (lambda f: f())
+        self.process = None
+        self.transcript = None
+        self.listeners = {}
+        self.lock = threading.Lock()
+        self.count = 0
+        self.pending_results = {}
+        self.result_callbacks = {}
+        self.run_status = None
+        self.last_result = ""
+        self.last_line = ""
+
+    def on(self, event, callback):
+        self.listeners.setdefault(event, []).append(callback)
+
+    def emit(self, event, *args):
+        for callback in self.listeners.get(event, []):
+            try:
+                callback(*args)
+            except:
+                traceback.print_exc()
+
+    def start(self, commandline, cwd=None, record=None):
+        self.process = subprocess.Popen(commandline, shell=True, cwd=cwd,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.begin(record)
+
+    def replay(self, path, speed=0):
+        self.process = TranscriptReplay(path, speed)
+        self.begin(None)
+
+    def begin(self, record):
+        self.transcript = None
+        if record != None:
+            self.transcript = TranscriptRecorder(record)
+        self.run_status = None
+        self.pending_results = {}
+        self.result_callbacks = {}
+        t = threading.Thread(target=self.read_output, args=(self.process.stdout,))
+        t.start()
+
+    def is_running(self):
+        return self.process != None and self.process.poll() == None
+
+    def is_replay(self):
+        return isinstance(self.process, TranscriptReplay)
+
+    def write(self, text):
+        if self.transcript != None:
+            self.transcript.record(">", text)
+        self.emit("write", text)
+        self.process.stdin.write(text)
+        self.process.stdin.flush()
+
+    def wait_for_results(self, tokens, timeout, cmd):
+        timeoutcount = timeout/0.001
+        i = 0
+        while i < timeoutcount:
+            done = True
+            for token in tokens:
+                if self.pending_results[token] == None:
+                    done = False
+                    break
+            if done:
+                break
+            i += 1
+            time.sleep(0.001)
+        results = [self.pending_results.pop(token) for token in tokens]
+        if i >= timeoutcount:
+            raise ValueError("Command \"%s\" took longer than %d seconds to perform?" % (cmd, timeout))
+        return results
+
+    def run_cmd(self, cmd, block=False, mimode=True, timeout=10, callback=None):
+        if not self.is_running():
+            return "0^error,msg=\"no session running\""
+
+        self.lock.acquire()
+        try:
+            if mimode:
+                self.count = self.count + 1
+                self.emit("command", self.count, cmd)
+                cmd = "%d%s\n" % (self.count, cmd)
+                if block:
+                    self.pending_results[self.count] = None
+                elif callback != None:
+                    self.result_callbacks[self.count] = callback
+            else:
+                cmd = "%s\n\n" % cmd
+            token = self.count
+            self.write(cmd)
+        finally:
+            self.lock.release()
+        if block:
+            if mimode:
+                return self.wait_for_results([token], timeout, cmd)[0]
+            countstr = "%d^" % token
+            timeoutcount = timeout/0.001
+            i = 0
+            while not self.last_result.startswith(countstr) and i < timeoutcount:
+                i += 1
+                time.sleep(0.001)
+            if i >= timeoutcount:
+                raise ValueError("Command \"%s\" took longer than %d seconds to perform?" % (cmd, timeout))
+            return self.last_result
+        return token
+
+    def run_cmds(self, cmds, timeout=10):
+        # Sends all the commands in one go and then waits for all of
+        # their results, rather than doing a round trip per command.
+        if not self.is_running():
+            return ["0^error,msg=\"no session running\""] * len(cmds)
+        if len(cmds) == 0:
+            return []
+
+        tokens = []
+        self.lock.acquire()
+        try:
+            out = ""
+            for cmd in cmds:
+                self.count = self.count + 1
+                self.pending_results[self.count] = None
+                self.emit("command", self.count, cmd)
+                tokens.append(self.count)
+                out += "%d%s\n" % (self.count, cmd)
+            self.write(out)
+        finally:
+            self.lock.release()
+        return self.wait_for_results(tokens, timeout, cmds[0])
+
+    def parse_async_record(self, line):
+        comma = line.find(",")
+        if comma == -1:
+            return line[1:], {}
+        return line[1:comma], self.parse(line[comma + 1:])
+
+    def handle_line(self, line):
+        if self.transcript != None:
+            self.transcript.record("<", line)
+        self.emit("line", line)
+
+        if line.startswith("="):
+            cls, res = self.parse_async_record(line)
+            self.emit("notify", cls, res)
+
+        run_status = run_status_regex.match(line)
+        if run_status != None:
+            self.run_status = run_status.group(2)
+            self.emit("status", self.run_status, line)
+        if not line.startswith("(gdb)"):
+            self.last_line = line
+        result = command_result_regex.match(line)
+        if result != None:
+            self.last_result = line
+            token = int(result.group(1))
+            self.emit("result", token, line)
+            if token in self.pending_results:
+                self.pending_results[token] = line
+            elif token in self.result_callbacks:
+                callback = self.result_callbacks.pop(token)
+                self.dispatch(lambda c=callback, l=line: c(l))
+
+        if line.startswith("~"):
+            self.emit("console", unescape_stream(line))
+
+    def read_output(self, pipe):
+        while True:
+            try:
+                if self.process.poll() != None:
+                    break
+                line = pipe.readline().strip()
+                if len(line) > 0:
+                    self.handle_line(line)
+            except:
+                traceback.print_exc()
+        self.run_status = None
+        if self.transcript != None:
+            self.transcript.close()
+            self.transcript = None
+        self.emit("exit")
+
+    def redirect_target_output(self):
+        # The program's output goes to a file that is followed and
+        # reported as target events
+        pipe, name = tempfile.mkstemp()
+        t = threading.Thread(target=self.read_target_output, args=(os.fdopen(pipe),))
+        t.start()
+        self.run_cmd("-inferior-tty-set %s" % name)
+
+    def read_target_output(self, pipe):
+        exception_count = 0
+        while exception_count < 100:
+            try:
+                proc = self.process.poll() != None
+                line = pipe.readline()
+                if len(line) > 0:
+                    self.emit("target", line)
+                else:
+                    if proc:
+                        break
+                    time.sleep(0.1)
+            except:
+                traceback.print_exc()
+                exception_count = exception_count + 1
+        if not pipe == None:
+            pipe.close()
+
+    def exit(self, timeout=10):
+        if self.is_running():
+            if self.run_status == "running":
+                self.run_cmd("-exec-interrupt --all", True, timeout=timeout)
+            # gdb may well be gone before its ^exit is read
+            self.run_cmd("-gdb-exit")
+            self.process.wait()
@@ -0,0 +1,178 @@
+import json
+import re
+import threading
+import time
+import Queue
+
+command_regex = re.compile("^(\d*)(.*)$")
+token_regex = re.compile("^(\d+)(\D.*)$")
+
+
+class TranscriptRecorder:
+    def __init__(self, path):
+        self.file = open(path, "w")
+        self.start = time.time()
+        self.lock = threading.Lock()
+
+    def write(self, entry):
+        self.lock.acquire()
+        try:
+            entry["t"] = round(time.time() - self.start, 6)
+            self.file.write("%s\n" % json.dumps(entry))
+            self.file.flush()
+        finally:
+            self.lock.release()
+
+    def record(self, direction, text):
+        # direction is ">" for what was sent to gdb and "<" for what
+        # gdb printed
+        for line in text.splitlines():
+            if len(line.strip()) > 0:
+                # latin-1 so that any bytes gdb printed survive the trip
+                self.write({"dir": direction, "line": line.decode("latin-1")})
+
+    def render(self, elapsed):
+        self.write({"render": elapsed})
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.file.close()
+        finally:
+            self.lock.release()
+
+
+class TranscriptExchange:
+    def __init__(self, token, cmd, t):
+        self.token = token
+        self.cmd = cmd
+        self.t = t
+        # (seconds since the command was sent, line)
+        self.output = []
+        self.used = False
+
+
+def load_transcript(path):
+    f = open(path)
+    try:
+        entries = [json.loads(line) for line in f if len(line.strip()) > 0]
+    finally:
+        f.close()
+    for entry in entries:
+        if "line" in entry:
+            entry["line"] = entry["line"].encode("latin-1")
+    return entries
+
+
+class ReplayInput:
+    def __init__(self, replay):
+        self.replay = replay
+
+    def write(self, text):
+        for line in text.splitlines():
+            if len(line.strip()) > 0:
+                self.replay.command(line.strip())
+
+    def flush(self):
+        pass
+
+
+class ReplayOutput:
+    def __init__(self):
+        self.queue = Queue.Queue()
+
+    def readline(self):
+        return self.queue.get()
+
+    def close(self):
+        pass
+
+
+class TranscriptReplay:
+    # Stands in for the gdb process. Every command written to stdin is
+    # matched to the next unused recorded command and answered with the
+    # output that followed it, with the tokens rewritten to the ones
+    # used now. speed scales the recorded delays, 0 replays as fast as
+    # possible.
+    def __init__(self, path, speed=0):
+        self.speed = speed
+        self.prologue = []
+        self.exchanges = []
+        self.renders = []
+        for entry in load_transcript(path):
+            if "render" in entry:
+                self.renders.append(entry["render"])
+            elif entry["dir"] == ">":
+                token, cmd = command_regex.match(entry["line"]).groups()
+                self.exchanges.append(TranscriptExchange(token, cmd, entry["t"]))
+            elif len(self.exchanges) > 0:
+                ex = self.exchanges[-1]
+                ex.output.append((entry["t"] - ex.t, entry["line"]))
+            else:
+                self.prologue.append((0, entry["line"]))
+        self.next = 0
+        self.tokens = {}
+        self.returncode = None
+        self.pending = Queue.Queue()
+        self.stdin = ReplayInput(self)
+        self.stdout = ReplayOutput()
+        t = threading.Thread(target=self.feed)
+        t.start()
+        self.pending.put(self.prologue)
+
+    def find(self, cmd):
+        # Falls back to the same MI command with other arguments, like
+        # the temporary file given to -inferior-tty-set
+        name = cmd.split(" ")[0]
+        for exact in (True, False):
+            for ex in self.exchanges[self.next:]:
+                if ex.used:
+                    continue
+                if (exact and ex.cmd == cmd) or (not exact and ex.cmd.split(" ")[0] == name):
+                    return ex
+        return None
+
+    def command(self, line):
+        token, cmd = command_regex.match(line).groups()
+        ex = self.find(cmd)
+        if ex == None:
+            if len(token) > 0:
+                msg = "Not in the transcript: %s" % cmd
+                self.pending.put([(0, "%s^error,msg=%s" % (token, json.dumps(msg)))])
+            return
+        ex.used = True
+        while self.next < len(self.exchanges) and self.exchanges[self.next].used:
+            self.next += 1
+        if len(ex.token) > 0 and len(token) > 0:
+            self.tokens[ex.token] = token
+        self.pending.put(ex.output)
+        if cmd.startswith("-gdb-exit") or cmd == "quit":
+            self.pending.put(None)
+
+    def rewrite(self, line):
+        m = token_regex.match(line)
+        if m != None and m.group(1) in self.tokens:
+            return self.tokens[m.group(1)] + m.group(2)
+        return line
+
+    def feed(self):
+        while True:
+            output = self.pending.get()
+            if output == None:
+                break
+            last = 0
+            for t, line in output:
+                if self.speed > 0 and t > last:
+                    time.sleep((t - last) * self.speed)
+                last = t
+                self.stdout.queue.put("%s\n" % self.rewrite(line))
+        self.returncode = 0
+        self.stdout.queue.put("")
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        while self.returncode == None:
+            time.sleep(0.01)
+        return self.returncode
@@ -22,29 +22,91 @@ freely, subject to the following restrictions:
 """
 import sublime
 import sublime_plugin
-import subprocess
 import struct
-import tempfile
 import threading
 import time
 import traceback
 import os
 import re
+import json
+import hashlib
+import fnmatch
+import collections
 import Queue
-from resultparser import parse_result_line
+import gdbengine
+from gdbengine import get_result
 from types import ListType
 
 
+# (view id, key) -> value, cleared whenever any of the settings
+# that were looked at change
+gdb_settings = None
+gdb_settings_cache = {}
+gdb_settings_watched = set()
+
+
+def settings_changed():
+    gdb_settings_cache.clear()
+    gdb_breakpoint_view.store_paths.clear()
+
+
+def get_plugin_settings():
+    global gdb_settings
+    if gdb_settings == None:
+        gdb_settings = sublime.load_settings("SublimeGDB.sublime-settings")
+        gdb_settings.add_on_change("sublimegdb", settings_changed)
+    return gdb_settings
+
+
+def lookup_setting(key, view):
+    if view != None:
+        s = view.settings()
+        if view.id() not in gdb_settings_watched:
+            gdb_settings_watched.add(view.id())
+            s.add_on_change("sublimegdb", settings_changed)
+        if s.has("sublimegdb_%s" % key):
+            return s.get("sublimegdb_%s" % key)
+    return get_plugin_settings().get(key)
+
+
 def get_setting(key, default=None, view=None):
     try:
         if view == None:
             view = sublime.active_window().active_view()
-        s = view.settings()
-        if s.has("sublimegdb_%s" % key):
-            return s.get("sublimegdb_%s" % key)
+        id = view.id()
     except:
-        pass
-    return sublime.load_settings("SublimeGDB.sublime-settings").get(key, default)
+        view = None
+        id = None
+    if (id, key) in gdb_settings_cache:
+        value = gdb_settings_cache[(id, key)]
+    else:
+        value = lookup_setting(key, view)
+        gdb_settings_cache[(id, key)] = value
+    if value == None:
+        return default
+    return value
+
+
+def get_int_setting(key, default=0, view=None):
+    try:
+        return int(get_setting(key, default, view))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_bool_setting(key, default=False, view=None):
+    # bool() would take a string like "false" as True
+    value = get_setting(key, default, view)
+    if not isinstance(value, bool):
+        return default
+    return value
+
+
+def get_list_setting(key, default=None, view=None):
+    value = get_setting(key, default, view)
+    if not type(value) is ListType:
+        return default if default != None else []
+    return value
 
 
 def expand_path(value, window):
@@ -72,6 +134,7 @@ def expand_path(value, window):
     value = re.sub(r'\${project_path:(?P<file>[^}]+)}', lambda m: len(get_existing_files(m)) > 0 and get_existing_files(m)[0] or m.group('file'), value)
     value = re.sub(r'\${env:(?P<variable>.*)}', lambda m: os.getenv(m.group('variable')), value)
     value = re.sub(r'\${home}', os.getenv('HOME') or os.getenv('USERPROFILE'), value)
+    value = value.replace('${packages}', sublime.packages_path())
     value = re.sub(r'\${folder:(?P<file>.*)}', lambda m: os.path.dirname(m.group('file')), value)
     value = value.replace('\\', '/')
 
@@ -81,8 +144,6 @@ def expand_path(value, window):
 DEBUG = get_setting("debug", True)
 DEBUG_FILE = get_setting("debug_file", "/tmp/sublimegdb.txt")
 
-gdb_lastresult = ""
-gdb_lastline = ""
 gdb_cursor = ""
 gdb_cursor_position = 0
 gdb_last_cursor_view = None
@@ -91,25 +152,210 @@ gdb_bkp_window = None
 gdb_bkp_view = None
 
 gdb_shutting_down = False
-gdb_process = None
+# When the last stop that is to be rendered was read, and how long
+# each stop took to render
+gdb_stop_time = None
+gdb_render_times = []
 gdb_stack_frame = None
 gdb_stack_index = 0
 
+# Bumped every time the inferior stops, anything cached for a
+# stop is only valid as long as the epoch hasn't changed
+gdb_stop_epoch = 0
+gdb_cursor_epoch = -1
+gdb_cursor_thread = -1
+gdb_thread_states = {}
+
 gdb_nonstop = False
+# The trace frame being browsed with -trace-find, or -1 when looking
+# at the live target
+gdb_trace_frame = -1
+
+# Steps requested while a step is still in progress are queued and
+# sent straight from the output thread, the stops in between aren't
+# rendered but kept as a trail
+gdb_step_lock = threading.Lock()
+gdb_stepping = False
+gdb_step_queue = []
+gdb_step_trail = []
+gdb_step_cmd = None
+# gdb's skip can't match shared libraries, so steps that end up in
+# the address ranges of these are stepped back out of instead
+gdb_skip_libraries = []
+gdb_skipped_ranges = {}
 
 if os.name == 'nt':
     gdb_nonstop = False
 
 
 gdb_run_status = None
-result_regex = re.compile("(?<=\^)[^,\"]*")
 collapse_regex = re.compile("{.*}", re.DOTALL)
 
 
+gdb_normalized = {}
+
+
 def normalize(filename):
     if filename is None:
         return None
-    return os.path.abspath(os.path.normcase(filename))
+    if filename not in gdb_normalized:
+        gdb_normalized[filename] = os.path.abspath(os.path.normcase(filename))
+    return gdb_normalized[filename]
+
+
+class GDBTiming:
+    # Upper bounds in milliseconds of the histogram buckets
+    buckets = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.parse = 0.0
+        self.histogram = [0] * (len(self.buckets) + 1)
+
+    def add(self, ms, size=0):
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.bytes += size
+        i = 0
+        while i < len(self.buckets) and ms > self.buckets[i]:
+            i += 1
+        self.histogram[i] += 1
+
+    def format(self, name):
+        avg = self.total / self.count if self.count > 0 else 0
+        out = "%-32s %6d %9.1f %9.1f %9.1f" % (name, self.count, avg, self.max, self.total)
+        if self.bytes > 0 or self.parse > 0:
+            out += " %9d %9.1f" % (self.bytes / max(1, self.count), self.parse)
+        out += "\n"
+        # One character per bucket, scaled to the fullest bucket
+        bars = " .:-=+*#%@"
+        most = max(self.histogram)
+        if most > 0:
+            out += "%-32s [%s]\n" % ("", "".join([bars[(len(bars) - 1) * n / most] for n in self.histogram]))
+        return out
+
+    def get_data(self):
+        return {"count": self.count, "total_ms": self.total, "max_ms": self.max,
+                "bytes": self.bytes, "parse_ms": self.parse,
+                "histogram": dict(zip([str(b) for b in self.buckets] + ["more"], self.histogram))}
+
+
+class GDBStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+        self.stages = {}
+        # token -> (command, time sent)
+        self.sent = {}
+        # token -> command, for results that haven't been parsed yet
+        self.results = {}
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.commands = {}
+            self.stages = {}
+            self.sent = {}
+            self.results = {}
+        finally:
+            self.lock.release()
+
+    def session_ended(self):
+        # Commands that timed out or were still waiting when gdb went
+        # away will never get their results
+        self.lock.acquire()
+        try:
+            self.sent = {}
+            self.results = {}
+        finally:
+            self.lock.release()
+
+    def get_timing(self, d, name):
+        if name not in d:
+            d[name] = GDBTiming()
+        return d[name]
+
+    def command_sent(self, token, cmd):
+        self.lock.acquire()
+        try:
+            self.sent[token] = (cmd.split(" ")[0], time.time())
+        finally:
+            self.lock.release()
+
+    def result_read(self, token, line):
+        self.lock.acquire()
+        try:
+            if token not in self.sent:
+                return
+            cmd, sent = self.sent.pop(token)
+            self.get_timing(self.commands, cmd).add((time.time() - sent) * 1000, len(line))
+            if len(self.results) > 1000:
+                # Results that were never parsed
+                self.results.clear()
+            self.results[str(token)] = cmd
+        finally:
+            self.lock.release()
+
+    def result_parsed(self, line, ms):
+        token = line[:line.find("^")] if "^" in line else ""
+        self.lock.acquire()
+        try:
+            cmd = self.results.pop(token, "(async records)")
+            self.get_timing(self.commands, cmd).parse += ms
+        finally:
+            self.lock.release()
+
+    def add_stage(self, stage, ms):
+        self.lock.acquire()
+        try:
+            self.get_timing(self.stages, stage).add(ms)
+        finally:
+            self.lock.release()
+
+    def format(self):
+        self.lock.acquire()
+        try:
+            header = "%-32s %6s %9s %9s %9s" % ("", "count", "avg ms", "max ms", "total ms")
+            out = "Stop refresh stages\n%s\n" % header
+            for name, t in sorted(self.stages.items(), key=lambda i: -i[1].total):
+                out += t.format(name)
+            out += "\nCommands\n%s %9s %9s\n" % (header, "avg bytes", "parse ms")
+            for name, t in sorted(self.commands.items(), key=lambda i: -i[1].total):
+                out += t.format(name)
+            out += "\nHistogram buckets (ms): %s, more\n" % ", ".join([str(b) for b in GDBTiming.buckets])
+            return out
+        finally:
+            self.lock.release()
+
+    def get_data(self):
+        self.lock.acquire()
+        try:
+            return {"stages": dict([(k, v.get_data()) for k, v in self.stages.items()]),
+                    "commands": dict([(k, v.get_data()) for k, v in self.commands.items()])}
+        finally:
+            self.lock.release()
+
+
+gdb_stats = GDBStats()
+
+
+def parse_result_line(line):
+    start = time.time()
+    ret = gdbengine.parse_result_line(line)
+    gdb_stats.result_parsed(line, (time.time() - start) * 1000)
+    return ret
+
+
+def timed(stage, func, *args):
+    start = time.time()
+    try:
+        return func(*args)
+    finally:
+        gdb_stats.add_stage(stage, (time.time() - start) * 1000)
 
 
 def log_debug(line):
@@ -125,29 +371,80 @@ class GDBView(object):
         self.doScroll = s
         self.view = None
         self.settingsprefix = settingsprefix
+        self.dirty = False
+        self.polling = False
+        self.viewport = None
 
     def is_open(self):
         return not self.closed
 
+    def is_visible(self):
+        if not self.is_open() or self.view.window() == None:
+            return False
+        window = self.view.window()
+        group, index = window.get_view_index(self.view)
+        active = window.active_view_in_group(group)
+        return active != None and active.id() == self.view.id()
+
     def open_at_start(self):
         if self.settingsprefix != None:
-            return get_setting("%s_open" % self.settingsprefix, False)
+            return get_bool_setting("%s_open" % self.settingsprefix, False)
         return False
 
     def open(self):
         if self.view == None or self.view.window() == None:
             if self.settingsprefix != None:
-                sublime.active_window().focus_group(get_setting("%s_group" % self.settingsprefix, 0))
+                sublime.active_window().focus_group(get_int_setting("%s_group" % self.settingsprefix, 0))
             self.create_view()
 
     def close(self):
         if self.view != None:
             if self.settingsprefix != None:
-                sublime.active_window().focus_group(get_setting("%s_group" % self.settingsprefix, 0))
+                sublime.active_window().focus_group(get_int_setting("%s_group" % self.settingsprefix, 0))
             self.destroy_view()
 
     def should_update(self):
-        return self.is_open() and is_running() and gdb_run_status == "stopped"
+        if not (self.is_open() and is_running() and (gdb_run_status == "stopped" or gdb_trace_frame != -1)):
+            return False
+        if not self.is_visible():
+            # Background tabs are brought up to date once activated
+            self.dirty = True
+            return False
+        self.dirty = False
+        return True
+
+    def on_activated(self):
+        if self.dirty and self.should_update():
+            self.catch_up()
+        elif self.polling and gdb_run_status == "stopped":
+            self.viewport_changed()
+
+    def catch_up(self):
+        pass
+
+    def watch_viewport(self):
+        # Sublime Text 2 has no scroll event, so views that only fill
+        # in the rows that can be seen poll for the viewport moving
+        # for as long as the inferior stays stopped
+        if self.polling or not self.is_open():
+            return
+        self.polling = True
+        self.viewport = self.get_view().viewport_position()
+        sublime.set_timeout(self.poll_viewport, 250)
+
+    def poll_viewport(self):
+        if not self.is_open() or gdb_run_status != "stopped":
+            self.polling = False
+            return
+        pos = self.get_view().viewport_position()
+        if pos != self.viewport:
+            self.viewport = pos
+            if self.is_visible():
+                self.viewport_changed()
+        sublime.set_timeout(self.poll_viewport, 250)
+
+    def viewport_changed(self):
+        pass
 
     def set_syntax(self, syntax):
         if self.is_open():
@@ -179,6 +476,11 @@ class GDBView(object):
             else:
                 self.do_clear(None)
 
+    def replace_lines(self, start, end, text):
+        if self.is_open():
+            self.queue.put((self.do_replace_lines, (start, end, text)))
+            sublime.set_timeout(self.update, 0)
+
     def create_view(self):
         self.view = sublime.active_window().new_file()
         self.view.set_name(self.name)
@@ -226,6 +528,15 @@ class GDBView(object):
         self.view.end_edit(e)
         self.view.set_read_only(True)
 
+    def do_replace_lines(self, data):
+        start, end, text = data
+        self.view.set_read_only(False)
+        e = self.view.begin_edit()
+        region = sublime.Region(self.view.text_point(start, 0), self.view.text_point(end, 0))
+        self.view.replace(e, region, text)
+        self.view.end_edit(e)
+        self.view.set_read_only(True)
+
     def do_scroll(self, data):
         self.view.run_command("goto_line", {"line": data + 1})
 
@@ -252,7 +563,8 @@ class GDBView(object):
             traceback.print_exc()
 
     def on_session_ended(self):
-        if get_setting("%s_clear_on_end" % self.settingsprefix, True):
+        self.dirty = False
+        if get_bool_setting("%s_clear_on_end" % self.settingsprefix, True):
             self.clear()
 
 
@@ -317,7 +629,7 @@ class GDBVariable:
         line = run_cmd("-var-assign %s \"%s\"" % (self.get_name(), val), True)
         if get_result(line) == "done":
             self.valuepair["value"] = parse_result_line(line)["value"]
-            gdb_variables_view.update_variables(True)
+            gdb_variables_view.refresh()
         else:
             err = line[line.find("msg=") + 4:]
             sublime.status_message("Error: %s" % err)
@@ -454,6 +766,7 @@ class GDBRegisterView(GDBView):
     def __init__(self):
         super(GDBRegisterView, self).__init__("GDB Registers", s=False, settingsprefix="registers")
         self.values = None
+        self.dirtylist = []
 
     def open(self):
         super(GDBRegisterView, self).open()
@@ -472,6 +785,9 @@ class GDBRegisterView(GDBView):
             return []
         return parse_result_line(line)["register-values"]
 
+    def catch_up(self):
+        self.update_values()
+
     def update_values(self):
         if not self.should_update():
             return
@@ -491,6 +807,19 @@ class GDBRegisterView(GDBView):
                 reg = int(regvals[i]["number"])
                 if reg < len(self.values):
                     self.values[reg].set_value(regvals[i]["value"])
+        self.dirtylist = dirtylist
+        self.render()
+
+    def get_state(self):
+        return (self.values, self.dirtylist)
+
+    def set_state(self, state):
+        self.values, self.dirtylist = state
+        if self.is_open() and self.values != None:
+            self.render()
+
+    def render(self):
+        dirtylist = self.dirtylist
         pos = self.get_view().viewport_position()
         self.clear()
         line = 0
@@ -526,10 +855,31 @@ class GDBRegisterView(GDBView):
         return None
 
 
+gdb_varobj_epoch = -1
+gdb_varobj_changes = []
+
+
+def update_varobjs(force=False):
+    # A single -var-update for every varobj, those of the variables
+    # view as well as the watch expressions, once per stop
+    global gdb_varobj_epoch
+    global gdb_varobj_changes
+    if force or gdb_varobj_epoch != gdb_stop_epoch:
+        ret = parse_result_line(run_cmd("-var-update --all-values *", True))["changelist"]
+        if "varobj" in ret:
+            ret = listify(ret["varobj"])
+        gdb_varobj_epoch = gdb_stop_epoch
+        gdb_varobj_changes = ret
+        gdb_watch_view.apply_changes(ret)
+    return gdb_varobj_changes
+
+
 class GDBVariablesView(GDBView):
     def __init__(self):
         super(GDBVariablesView, self).__init__("GDB Variables", False, settingsprefix="variables")
         self.variables = []
+        self.snapshots = {}
+        self.stop_level = 0
 
     def open(self):
         super(GDBVariablesView, self).open()
@@ -578,31 +928,60 @@ class GDBVariablesView(GDBView):
         var['exp'] = exp
         return GDBVariable(var)
 
+    def get_tracked(self):
+        tracked = []
+        for level in self.snapshots:
+            for var in self.snapshots[level]:
+                tracked.append((self.snapshots[level], var))
+        return tracked
+
+    def update_values(self, force=False):
+        tracked = self.get_tracked()
+        for l, var in tracked:
+            var.clear_dirty()
+        ret = update_varobjs(force)
+        for value in ret:
+            name = value["name"]
+            for l, var in tracked:
+                real = var.find(name)
+                if real != None:
+                    if  "in_scope" in value and value["in_scope"] == "false":
+                        real.delete()
+                        if real in l:
+                            l.remove(real)
+                        continue
+                    real.update(value)
+                    if not "value" in value and not "new_value" in value:
+                        real.update_value()
+                    break
+
+    def add_frame_variables(self):
+        args = self.extract_varnames(parse_result_line(run_cmd("-stack-list-arguments 0 %d %d" % (gdb_stack_index, gdb_stack_index), True))["stack-args"]["frame"]["args"])
+        for arg in args:
+            self.add_variable(arg)
+        loc = self.extract_varnames(parse_result_line(run_cmd("-stack-list-locals 0", True))["locals"])
+        for var in loc:
+            self.add_variable(var)
+
+    def catch_up(self):
+        # Stops were missed while hidden, so the frame can't be
+        # assumed to be the same as the one last shown
+        self.update_variables(False)
+
     def update_variables(self, sameFrame):
         if not self.should_update():
             return
+        # Variables of the frames that were browsed during the last
+        # stop are only valid for that stop, except for the frame
+        # we stopped in which might still be the same frame.
+        self.variables = self.snapshots.pop(self.stop_level, [])
+        for level in self.snapshots:
+            for var in self.snapshots[level]:
+                var.delete()
+        self.snapshots = {gdb_stack_index: self.variables}
+
         if sameFrame:
-            for var in self.variables:
-                var.clear_dirty()
-            ret = parse_result_line(run_cmd("-var-update --all-values *", True))["changelist"]
-            if "varobj" in ret:
-                ret = listify(ret["varobj"])
-            dellist = []
-            for value in ret:
-                name = value["name"]
-                for var in self.variables:
-                    real = var.find(name)
-                    if real != None:
-                        if  "in_scope" in value and value["in_scope"] == "false":
-                            real.delete()
-                            dellist.append(real)
-                            continue
-                        real.update(value)
-                        if not "value" in value and not "new_value" in value:
-                            real.update_value()
-                        break
-            for item in dellist:
-                self.variables.remove(item)
+            self.update_values()
             if len(self.variables) == 0:
                 # Is it really the same frame? Seems everything was removed, so might as well pull all data again
                 sameFrame = False
@@ -622,15 +1001,48 @@ class GDBVariablesView(GDBView):
         if not sameFrame:
             for var in self.variables:
                 var.delete()
-            args = self.extract_varnames(parse_result_line(run_cmd("-stack-list-arguments 0 %d %d" % (gdb_stack_index, gdb_stack_index), True))["stack-args"]["frame"]["args"])
             self.variables = []
-            for arg in args:
-                self.add_variable(arg)
-            loc = self.extract_varnames(parse_result_line(run_cmd("-stack-list-locals 0", True))["locals"])
-            for var in loc:
-                self.add_variable(var)
+            self.add_frame_variables()
+            self.snapshots = {gdb_stack_index: self.variables}
+        self.stop_level = int(gdb_stack_frame["level"]) if gdb_stack_frame != None else gdb_stack_index
+        self.update_view()
+
+    def select_frame(self, level):
+        if not self.should_update():
+            return
+        if level in self.snapshots:
+            self.variables = self.snapshots[level]
+        else:
+            self.variables = []
+            self.add_frame_variables()
+            self.snapshots[level] = self.variables
+        self.update_view()
+
+    def get_state(self):
+        return (self.variables, self.snapshots, self.stop_level)
+
+    def set_state(self, state):
+        self.variables, self.snapshots, self.stop_level = state
+        if self.is_open():
+            self.update_view()
+
+    def discard_state(self, state):
+        for level in state[1]:
+            for var in state[1][level]:
+                var.delete()
+
+    def refresh(self):
+        if not self.should_update():
+            return
+        self.update_values(True)
         self.update_view()
 
+    def on_session_ended(self):
+        super(GDBVariablesView, self).on_session_ended()
+        self.variables = []
+        self.snapshots = {}
+        self.stop_level = 0
+
     def get_variable_at_line(self, line, var_list=None):
         if var_list == None:
             var_list = self.variables
@@ -665,10 +1077,17 @@ class GDBVariablesView(GDBView):
 
 
 class GDBCallstackFrame:
-    def __init__(self, func, args):
+    def __init__(self, func, args, addr=None, filename=None, line=0):
         self.func = func
         self.args = args
+        self.addr = addr
+        self.filename = filename
+        self.line = line
         self.lines = 0
+        self.args_stale = False
+
+    def is_same(self, other):
+        return self.func == other.func and self.addr == other.addr
 
     def format(self):
         output = "%s(" % self.func
@@ -693,36 +1112,157 @@ class GDBCallstackView(GDBView):
     def open(self):
         super(GDBCallstackView, self).open()
         self.set_syntax("Packages/C++/C++.tmLanguage")
+        self.frames = []
         if self.is_open() and gdb_run_status == "stopped":
             self.update_callstack()
 
+    def on_session_ended(self):
+        super(GDBCallstackView, self).on_session_ended()
+        self.frames = []
+
+    def get_state(self):
+        return self.frames
+
+    def set_state(self, frames):
+        self.frames = frames
+        if self.is_open():
+            pos = self.get_view().viewport_position()
+            self.clear()
+            self.add_line("".join([f.format() for f in self.frames]))
+            self.set_viewport_position(pos)
+            self.update()
+
+    def list_frames(self, low, high):
+        line = run_cmd("-stack-list-frames %d %d" % (low, high), True)
+        if get_result(line) == "error":
+            return []
+        frames = []
+        for f in listify(parse_result_line(line)["stack"]["frame"]):
+            filename = f["fullname"] if "fullname" in f else None
+            frames.append(GDBCallstackFrame(f["func"] if "func" in f else "??", [], f["addr"] if "addr" in f else None,
+                                            filename, int(f["line"]) if "line" in f else 0))
+        return frames
+
+    def list_arguments(self, low, high):
+        args = listify(parse_result_line(run_cmd("-stack-list-arguments 1 %d %d" % (low, high), True))["stack-args"]["frame"])
+        return [arg["args"] if "args" in arg else {} for arg in args]
+
+    def probe_frames(self, depth):
+        # Walks the stack from the top in growing chunks until it
+        # finds frames that match the cached frames at the same
+        # distance from the bottom of the stack. Everything from there
+        # on is assumed to be unchanged and is reused as is. The addr
+        # of a frame is its pc, the same callee at the same depth
+        # can have a different caller, so a few frames in a row have
+        # to match.
+        offset = len(self.frames) - depth
+        frames = []
+        low = 0
+        chunk = 4
+        # Frame 0 is always refetched since it is the one executing
+        level = 1
+        while low < depth:
+            high = min(depth, low + chunk) - 1
+            frames += self.list_frames(low, high)
+            low = high + 1
+            chunk *= 2
+            while level < len(frames):
+                count = min(3, depth - level)
+                if level + count > len(frames):
+                    # Need more frames to tell
+                    break
+                if self.matches(frames, level, offset, count):
+                    return frames[:level], level + offset
+                level += 1
+        return frames, len(self.frames)
+
+    def matches(self, frames, level, offset, count):
+        for i in range(level, level + count):
+            old = i + offset
+            if old < 0 or old >= len(self.frames) or not self.frames[old].is_same(frames[i]):
+                return False
+        return True
+
+    def get_visible_rows(self):
+        view = self.get_view()
+        region = view.visible_region()
+        return view.rowcol(region.begin())[0], view.rowcol(region.end())[0]
+
+    def catch_up(self):
+        self.update_callstack()
+        update_view_markers()
+
+    def viewport_changed(self):
+        pos = self.get_view().viewport_position()
+        self.refresh_visible_args()
+        self.set_viewport_position(pos)
+        self.update()
+
+    def refresh_visible_args(self):
+        # Outer frames that were reused from an earlier stop only get
+        # their arguments refreshed once they can be seen
+        first, last = self.get_visible_rows()
+        line = 0
+        refresh = []
+        for i in range(len(self.frames)):
+            f = self.frames[i]
+            if f.args_stale and line <= last and line + f.lines > first:
+                refresh.append((i, line))
+            line += f.lines
+        if len(refresh) == 0:
+            return
+        args = self.list_arguments(refresh[0][0], refresh[-1][0])
+        for i, line in reversed(refresh):
+            f = self.frames[i]
+            j = i - refresh[0][0]
+            f.args = args[j] if j < len(args) else {}
+            f.args_stale = False
+            oldlines = f.lines
+            self.replace_lines(line, line + oldlines, f.format())
+
     def update_callstack(self):
         if not self.should_update():
             return
         global gdb_cursor_position
-        line = run_cmd("-stack-list-frames", True)
+        line = run_cmd("-stack-info-depth", True)
         if get_result(line) == "error":
             gdb_cursor_position = 0
             update_view_markers()
             return
-        frames = listify(parse_result_line(line)["stack"]["frame"])
-        args = listify(parse_result_line(run_cmd("-stack-list-arguments 1", True))["stack-args"]["frame"])
+        depth = int(parse_result_line(line)["depth"])
         pos = self.get_view().viewport_position()
-        self.clear()
 
-        self.frames = []
-        for i in range(len(frames)):
-            arg = {}
-            if len(args) > i:
-                arg = args[i]["args"]
-            f = GDBCallstackFrame(frames[i]["func"], arg)
-            self.frames.append(f)
-            self.add_line(f.format())
+        if depth == 0:
+            frames, reused = [], len(self.frames)
+        elif len(self.frames) == 0:
+            frames, reused = self.list_frames(0, depth - 1), 0
+        else:
+            frames, reused = self.probe_frames(depth)
+        if len(frames) > 0:
+            args = self.list_arguments(0, len(frames) - 1)
+            for i in range(len(frames)):
+                if i < len(args):
+                    frames[i].args = args[i]
+
+        kept = self.frames[reused:]
+        if len(kept) == 0:
+            self.clear()
+            for f in frames:
+                self.add_line(f.format())
+        else:
+            top = sum([f.lines for f in self.frames[:reused]])
+            for f in kept:
+                f.args_stale = True
+            self.replace_lines(0, top, "".join([f.format() for f in frames]))
+        self.frames = frames + kept
+        self.refresh_visible_args()
         self.set_viewport_position(pos)
         self.update()
+        if len(kept) > 0:
+            self.watch_viewport()
 
     def update_marker(self, pos_scope, pos_icon):
-        if self.is_open():
+        if self.is_open() and not self.dirty:
             view = self.get_view()
             if gdb_stack_index != -1:
                 line = 0
@@ -741,16 +1281,33 @@ class GDBCallstackView(GDBView):
             fl = self.frames[i].lines
             if row <= line + fl - 1:
                 run_cmd("-stack-select-frame %d" % i)
-                update_cursor()
+                select_frame(i)
                 break
             line += fl
 
 
+def format_thread_frame(frame):
+    if "func" not in frame:
+        return "???"
+    args = ""
+    if "args" in frame:
+        for arg in frame["args"]:
+            if len(args) > 0:
+                args += ", "
+            if "name" in arg:
+                args += arg["name"]
+            if "value" in arg:
+                args += " = " + arg["value"]
+    return "%s(%s);" % (frame["func"], args)
+
+
 class GDBThread:
-    def __init__(self, id, state="UNKNOWN", func="???()"):
+    def __init__(self, id, state="UNKNOWN", func="???()", group=None):
         self.id = id
         self.state = state
         self.func = func
+        self.group = group
+        self.stale = True
 
     def format(self):
         return "%03d - %10s - %s\n" % (self.id, self.state, self.func)
@@ -760,60 +1317,119 @@ class GDBThreadsView(GDBView):
     def __init__(self):
         super(GDBThreadsView, self).__init__("GDB Threads", s=False, settingsprefix="threads")
         self.threads = []
+        self.registry = {}
+        self.rendered = []
         self.current_thread = 0
 
     def open(self):
         super(GDBThreadsView, self).open()
         self.set_syntax("Packages/C++/C++.tmLanguage")
+        self.rendered = []
         if self.is_open() and gdb_run_status == "stopped":
             self.update_threads()
 
+    def on_session_ended(self):
+        super(GDBThreadsView, self).on_session_ended()
+        self.registry = {}
+        self.threads = []
+        self.rendered = []
+
+    # The registry is maintained from the async records gdb sends,
+    # these are called from the GDBSession reader thread (read_output).
+    def thread_created(self, id, group):
+        self.registry[id] = GDBThread(id, "running", group=group)
+
+    def thread_exited(self, id):
+        if id in self.registry:
+            del self.registry[id]
+
+    def thread_group_exited(self, group):
+        for thread in self.registry.values():
+            if thread.group == group:
+                del self.registry[thread.id]
+
+    def get_affected(self, ids):
+        if ids == "all":
+            return self.registry.values()
+        return [self.registry[int(id)] for id in listify(ids) if int(id) in self.registry]
+
+    def threads_running(self, ids):
+        for thread in self.get_affected(ids):
+            thread.state = "running"
+            thread.stale = True
+
+    def threads_stopped(self, ids, id, frame):
+        for thread in self.get_affected(ids):
+            thread.state = "stopped"
+            thread.stale = True
+        if id in self.registry and frame != None:
+            self.registry[id].func = format_thread_frame(frame)
+            self.registry[id].stale = False
+
+    def seed_threads(self):
+        res = run_cmd("-thread-info", True)
+        if get_result(res) == "error":
+            return
+        for thread in listify(parse_result_line(res)["threads"]):
+            t = GDBThread(int(thread["id"]), thread["state"])
+            if "frame" in thread:
+                t.func = format_thread_frame(thread["frame"])
+                t.stale = False
+            self.registry[t.id] = t
+
+    def refresh_thread(self, thread):
+        res = run_cmd("-thread-info %d" % thread.id, True)
+        if get_result(res) == "error":
+            return
+        for info in listify(parse_result_line(res)["threads"]):
+            if "state" in info:
+                thread.state = info["state"]
+            if "frame" in info:
+                thread.func = format_thread_frame(info["frame"])
+        thread.stale = False
+
+    def get_visible_rows(self):
+        view = self.get_view()
+        region = view.visible_region()
+        return view.rowcol(region.begin())[0], view.rowcol(region.end())[0]
+
+    def catch_up(self):
+        self.update_threads()
+        update_view_markers()
+
+    def viewport_changed(self):
+        self.refresh_visible()
+        self.render_threads()
+
+    def refresh_visible(self):
+        # Frame info is only fetched for the rows that can be seen,
+        # the others are fetched when scrolled into view
+        first, last = self.get_visible_rows()
+        for thread in self.threads[first:last + 1]:
+            if thread.stale:
+                self.refresh_thread(thread)
+
     def update_threads(self):
         if not self.should_update():
             return
-        res = run_cmd("-thread-info", True)
-        ids = parse_result_line(run_cmd("-thread-list-ids", True))
-        if get_result(res) == "error":
-            if "thread-ids" in ids and "thread-id" in ids["thread-ids"]:
-                self.threads = [GDBThread(int(id)) for id in ids["thread-ids"]["thread-id"]]
-                if "threads" in ids and "thread" in ids["threads"]:
-                    for thread in ids["threads"]["thread"]:
-                        if "thread-id" in thread and "state" in thread:
-                            tid = int(thread["thread-id"])
-                            for t2 in self.threads:
-                                if t2.id == tid:
-                                    t2.state = thread["state"]
-                                    break
-                else:
-                    l = parse_result_line(run_cmd("-thread-info", True))
-            else:
-                self.threads = []
-        else:
-            l = parse_result_line(res)
-            self.threads = []
-            for thread in l["threads"]:
-                func = "???"
-                if "frame" in thread and "func" in thread["frame"]:
-                    func = thread["frame"]["func"]
-                    args = ""
-                    if "args" in thread["frame"]:
-                        for arg in thread["frame"]["args"]:
-                            if len(args) > 0:
-                                args += ", "
-                            if "name" in arg:
-                                args += arg["name"]
-                            if "value" in arg:
-                                args += " = " + arg["value"]
-                    func = "%s(%s);" % (func, args)
-                self.threads.append(GDBThread(int(thread["id"]), thread["state"], func))
-
-        if "current-thread-id" in ids:
-            self.current_thread = int(ids["current-thread-id"])
+        if len(self.registry) == 0:
+            self.seed_threads()
+        self.threads = sorted(self.registry.values(), key=lambda t: t.id)
+        self.refresh_visible()
+        self.render_threads()
+        self.watch_viewport()
+
+    def render_threads(self):
         pos = self.get_view().viewport_position()
-        self.clear()
-        self.threads.sort(key=lambda t: t.id)
-        for thread in self.threads:
-            self.add_line(thread.format())
+        lines = [thread.format() for thread in self.threads]
+        if len(lines) != len(self.rendered):
+            self.clear()
+            self.add_line("".join(lines))
+        else:
+            for i in range(len(lines)):
+                if lines[i] != self.rendered[i]:
+                    self.replace_lines(i, i + 1, lines[i])
+        self.rendered = lines
         self.set_viewport_position(pos)
         self.update()
 
@@ -840,7 +1456,124 @@ class GDBThreadsView(GDBView):
     def select(self, row):
         if row >= len(self.threads):
             return
-        self.select_thread(self.threads[row].id)
+        switch_thread(self.threads[row].id)
+
+
+class GDBStackGroup:
+    def __init__(self, frames):
+        self.frames = frames
+        self.threads = []
+        self.is_expanded = False
+        self.line = 0
+        self.lines = 0
+
+    def format(self, line=0):
+        funcs = " <- ".join([f.func for f in self.frames[:4]])
+        if len(self.frames) > 4:
+            funcs += " <- ..."
+        output = "%s %5d threads: %s\n" % ("-" if self.is_expanded else "+", len(self.threads), funcs)
+        if self.is_expanded:
+            for i in range(len(self.frames)):
+                f = self.frames[i]
+                loc = ""
+                if f.filename != None:
+                    loc = " at %s:%d" % (f.filename, f.line)
+                output += "    #%-3d %s %s%s\n" % (i, f.addr, f.func, loc)
+            output += "    threads: %s\n" % ", ".join([str(id) for id in self.threads])
+        self.line = line
+        self.lines = output.count("\n")
+        return (output, line + self.lines)
+
+
+class GDBUniqueStacksView(GDBView):
+    def __init__(self):
+        super(GDBUniqueStacksView, self).__init__("GDB Unique Stacks", s=False, settingsprefix="stacks")
+        self.groups = []
+        self.status = ""
+        self.collecting = False
+
+    def open(self):
+        super(GDBUniqueStacksView, self).open()
+        self.set_syntax("Packages/C++/C++.tmLanguage")
+        self.get_view().settings().set("word_wrap", False)
+
+    def on_session_ended(self):
+        super(GDBUniqueStacksView, self).on_session_ended()
+        self.groups = []
+
+    def collect(self):
+        if self.collecting:
+            return
+        self.collecting = True
+        args = (gdb_threads_view.registry.keys(),
+                get_int_setting("unique_stacks_max_depth", 32),
+                get_int_setting("unique_stacks_batch", 64),
+                get_int_setting("unique_stacks_timeout", 30))
+        t = threading.Thread(target=self.do_collect, args=args)
+        t.start()
+
+    def do_collect(self, ids, depth, batch, timeout):
+        # Runs outside of the main thread. Backtraces are fetched
+        # in pipelined batches and collapsed into one group per unique
+        # stack as they come in, so memory stays proportional to the
+        # number of distinct stacks rather than the number of threads.
+        try:
+            if len(ids) == 0:
+                res = parse_result_line(run_cmd("-thread-list-ids", True))
+                if "thread-ids" in res and "thread-id" in res["thread-ids"]:
+                    ids = [int(id) for id in listify(res["thread-ids"]["thread-id"])]
+            ids.sort()
+            deadline = time.time() + timeout
+            groups = {}
+            done = 0
+            while done < len(ids) and time.time() < deadline:
+                chunk = ids[done:done + batch]
+                results = run_cmds(["-stack-list-frames --thread %d 0 %d" % (id, depth - 1) for id in chunk], timeout=60)
+                for id, line in zip(chunk, results):
+                    if get_result(line) == "error":
+                        continue
+                    frames = []
+                    for f in listify(parse_result_line(line)["stack"]["frame"]):
+                        frames.append(GDBCallstackFrame(f["func"] if "func" in f else "??", [],
+                                                        f["addr"] if "addr" in f else None,
+                                                        f["fullname"] if "fullname" in f else None,
+                                                        int(f["line"]) if "line" in f else 0))
+                    key = tuple([(f.func, f.addr) for f in frames])
+                    if key not in groups:
+                        groups[key] = GDBStackGroup(frames)
+                    groups[key].threads.append(id)
+                done += len(chunk)
+            self.groups = sorted(groups.values(), key=lambda g: -len(g.threads))
+            self.status = "%d unique stacks in %d threads" % (len(self.groups), done)
+            if done < len(ids):
+                self.status += " (timed out, %d threads not collected)" % (len(ids) - done)
+        except:
+            traceback.print_exc()
+            self.status = "Failed to collect stacks"
+        self.collecting = False
+        sublime.set_timeout(self.update_view, 0)
+
+    def update_view(self):
+        if not self.is_open():
+            return
+        pos = self.get_view().viewport_position()
+        self.clear()
+        output = "%s\n" % self.status
+        line = 1
+        for group in self.groups:
+            text, line = group.format(line)
+            output += text
+        self.add_line(output)
+        self.set_viewport_position(pos)
+        self.update()
+        sublime.status_message(self.status)
+
+    def select(self, row):
+        for group in self.groups:
+            if row >= group.line and row < group.line + group.lines:
+                group.is_expanded = not group.is_expanded
+                self.update_view()
+                break
 
 
 class GDBDisassemblyView(GDBView):
@@ -848,6 +1581,8 @@ class GDBDisassemblyView(GDBView):
         super(GDBDisassemblyView, self).__init__("GDB Disassembly", s=False, settingsprefix="disassembly")
         self.start = -1
         self.end = -1
+        self.text = ""
+        self.pc = -1
 
     def open(self):
         super(GDBDisassemblyView, self).open()
@@ -860,18 +1595,36 @@ class GDBDisassemblyView(GDBView):
         super(GDBDisassemblyView, self).clear()
         self.start = -1
         self.end = -1
+        self.text = ""
 
     def add_insns(self, src_asm):
+        output = ""
         for asm in src_asm:
             line = "%s: %s" % (asm["address"], asm["inst"])
             if "func-name" in asm:
-                self.add_line("%-80s # %s+%s\n" % (line, asm["func-name"], asm["offset"]))
+                output += "%-80s # %s+%s\n" % (line, asm["func-name"], asm["offset"])
             else:
-                self.add_line("%s\n" % line)
+                output += "%s\n" % line
             addr = int(asm["address"], 16)
             if self.start == -1 or addr < self.start:
                 self.start = addr
             self.end = addr
+        return output
+
+    def get_state(self):
+        return (self.start, self.end, self.text, self.pc)
+
+    def set_state(self, state):
+        if not self.is_open():
+            return
+        self.clear()
+        self.start, self.end, self.text, self.pc = state
+        self.add_line(self.text)
+        self.update()
+        self.mark_pc()
+
+    def catch_up(self):
+        self.update_disassembly()
 
     def update_disassembly(self):
         if not self.should_update():
@@ -884,6 +1637,7 @@ class GDBDisassemblyView(GDBView):
             l = run_cmd("-data-disassemble -s $pc -e \"$pc+200\" -- 1", True)
             asms = parse_result_line(l)
             self.clear()
+            output = ""
             if get_result(l) != "error":
                 asms = asms["asm_insns"]
                 if "src_and_asm_line" in asms:
@@ -891,13 +1645,19 @@ class GDBDisassemblyView(GDBView):
                     for src_asm in l:
                         line = src_asm["line"]
                         file = src_asm["file"]
-                        self.add_line("%s:%s\n" % (file, line))
-                        self.add_insns(src_asm["line_asm_insn"])
+                        output += "%s:%s\n" % (file, line)
+                        output += self.add_insns(src_asm["line_asm_insn"])
                 else:
-                    self.add_insns(asms)
+                    output += self.add_insns(asms)
+            self.text = output
+            self.add_line(output)
             self.update()
+        self.pc = pc
+        self.mark_pc()
+
+    def mark_pc(self):
         view = self.get_view()
-        reg = view.find("^0x[0]*%x:" % pc, 0)
+        reg = view.find("^0x[0]*%x:" % self.pc, 0)
         if reg is None:
             view.erase_regions("sublimegdb.programcounter")
         else:
@@ -909,11 +1669,19 @@ class GDBDisassemblyView(GDBView):
 
 
 class GDBBreakpoint(object):
-    def __init__(self, filename, line):
+    def __init__(self, filename, line, insert=True):
         self.original_filename = normalize(filename)
         self.original_line = line
+        self.key = None
+        self.last_resolved = None
+        self.number = -1
+        self.condition = ""
+        self.ignore_count = 0
+        self.temporary = False
+        self.removed = False
         self.clear()
-        self.add()
+        if insert:
+            self.add()
 
     @property
     def line(self):
@@ -930,79 +1698,368 @@ class GDBBreakpoint(object):
     def clear(self):
         self.resolved_filename = ""
         self.resolved_line = 0
-        self.number = -1
-
-    def breakpoint_added(self, res):
-        if "bkpt" not in res:
-            return
-        bp = res["bkpt"]
-        if "fullname" in bp:
-            self.resolved_filename = bp["fullname"]
-        elif "file" in bp:
-            self.resolved_filename = bp["file"]
-        else:
-            self.resolved_filename = bp["original-location"].split(":", 1)[0]
-        if not "/" in self.resolved_filename and not "\\" in self.resolved_filename:
+        self.pending = False
+        self.enabled = True
+        self.times = 0
+        self.ignore_remaining = 0
+        self.location_count = 0
+        self.set_number(-1)
+        gdb_breakpoint_view.reindex(self)
+
+    def set_number(self, number):
+        gdb_breakpoint_view.renumber(self, number)
+
+    def update_state(self, bp):
+        if "times" in bp:
+            self.times = int(bp["times"])
+        if "enabled" in bp:
+            self.enabled = bp["enabled"] == "y"
+        self.condition = bp["cond"] if "cond" in bp else ""
+        self.ignore_remaining = int(bp["ignore"]) if "ignore" in bp else 0
+
+    def breakpoint_added(self, bps):
+        # bps is either the bkpt result of -break-insert or the
+        # one from a =breakpoint-created/modified notification. Older
+        # gdbs list the locations of a multiple location breakpoint
+        # as extra tuples after it, newer ones in a locations list.
+        bps = listify(bps)
+        bp = bps[0]
+        self.set_number(int(bp["number"]))
+        self.update_state(bp)
+        locations = bps[1:]
+        if "locations" in bp:
+            locations = listify(bp["locations"])
+        self.location_count = len(locations)
+        loc = bp
+        if "line" not in bp and len(locations) > 0:
+            loc = locations[0]
+
+        if "pending" in bp and "line" not in loc:
+            self.pending = True
             self.resolved_filename = self.original_filename
-        self.resolved_line = int(bp["line"] if "line" in bp else bp["original-location"].split(":", 1)[1])
-        self.number = int(bp["number"])
+            self.resolved_line = self.original_line
+        else:
+            self.pending = False
+            if "fullname" in loc:
+                self.resolved_filename = loc["fullname"]
+            elif "file" in loc:
+                self.resolved_filename = loc["file"]
+            else:
+                self.resolved_filename = bp["original-location"].split(":", 1)[0]
+            if not "/" in self.resolved_filename and not "\\" in self.resolved_filename:
+                self.resolved_filename = self.original_filename
+            self.resolved_line = int(loc["line"] if "line" in loc else bp["original-location"].split(":", 1)[1])
+            self.last_resolved = {"file": self.resolved_filename, "line": self.resolved_line}
+        gdb_breakpoint_view.reindex(self)
+
+    def get_store_data(self):
+        data = {"file": self.original_filename, "line": self.original_line}
+        if self.last_resolved != None:
+            data["resolved"] = self.last_resolved
+        if len(self.condition) > 0:
+            data["condition"] = self.condition
+        if self.ignore_count > 0:
+            data["ignore"] = self.ignore_count
+        if self.temporary:
+            data["temporary"] = True
+        return data
+
+    def shift(self, filename, delta):
+        if self.original_filename == filename:
+            self.original_line += delta
+        if self.number != -1 and normalize(self.resolved_filename) == filename:
+            self.resolved_line += delta
+            self.last_resolved = {"file": self.resolved_filename, "line": self.resolved_line}
+        gdb_breakpoint_view.reindex(self)
+
+    def get_location(self):
+        return "\"\\\"%s\\\":%d\"" % (self.original_filename.encode("unicode-escape"), self.original_line)
+
+    def get_insert_options(self):
+        # The condition and ignore count are given to gdb so that it
+        # can filter hits itself without ever stopping for us
+        options = "-f"
+        if self.temporary:
+            options += " -t"
+        if len(self.condition) > 0:
+            options += " -c %s" % mi_quote(self.condition)
+        if self.ignore_count > 0:
+            options += " -i %d" % self.ignore_count
+        return options
+
+    def set_condition(self, condition):
+        self.condition = condition
+        if self.number != -1:
+            if len(condition) > 0:
+                gdb_breakpoint_view.queue_command("-break-condition %d %s" % (self.number, mi_quote(condition)))
+            else:
+                # No expression makes the breakpoint unconditional
+                gdb_breakpoint_view.queue_command("-break-condition %d" % self.number)
 
-    def insert(self):
-        cmd = "-break-insert \"\\\"%s\\\":%d\"" % (self.original_filename.encode("unicode-escape"), self.original_line)
-        out = run_cmd(cmd, True)
+    def set_ignore_count(self, count):
+        self.ignore_count = count
+        if self.number != -1:
+            gdb_breakpoint_view.queue_command("-break-after %d %d" % (self.number, count))
+
+    def insert_cmd(self):
+        return "-break-insert %s %s" % (self.get_insert_options(), self.get_location())
+
+    def inserted(self, out):
         if get_result(out) == "error":
             return
         res = parse_result_line(out)
         if "bkpt" not in res and "matches" in res:
-            for match in res["matches"]["b"]:
-                cmd = "-break-insert *%s" % match["addr"]
-                out = run_cmd(cmd, True)
-                if get_result(out) == "error":
-                    return
-                res = parse_result_line(out)
-                self.breakpoint_added(res)
-        else:
-            self.breakpoint_added(res)
+            for match in listify(res["matches"]["b"]):
+                run_cmd("-break-insert *%s" % match["addr"], callback=self.inserted)
+            return
+        if self.inserted_after_removal(listify(res["bkpt"])[0]["number"]):
+            return
+        self.breakpoint_added(res["bkpt"])
+        gdb_breakpoint_view.schedule_update()
+
+    def inserted_after_removal(self, number):
+        # Removed while the insert was still on its way, so gdb has a
+        # breakpoint that nobody wants any more
+        if not self.removed:
+            return False
+        run_cmd("-break-delete %s" % number)
+        return True
 
     def add(self):
         if is_running():
-            res = wait_until_stopped()
-            self.insert()
-            if res:
-                resume()
+            gdb_breakpoint_view.queue_insert(self)
 
     def remove(self):
         if is_running():
-            res = wait_until_stopped()
-            run_cmd("-break-delete %s" % self.number)
-            if res:
-                resume()
+            gdb_breakpoint_view.queue_delete(self)
+
+    def format_state(self):
+        output = ""
+        if len(self.condition) > 0:
+            output += " if %s" % self.condition
+        if self.ignore_count > 0:
+            output += " ignore %d (%d left)" % (self.ignore_count, self.ignore_remaining)
+        if self.temporary:
+            output += " (temporary)"
+        if self.pending:
+            output += " (pending)"
+        if not self.enabled:
+            output += " (disabled)"
+        if self.location_count > 1:
+            output += " [%d locations]" % self.location_count
+        if self.times > 0:
+            output += " hits: %d" % self.times
+        return output
 
     def format(self):
-        return "%d - %s:%d\n" % (self.number, self.filename, self.line)
+        return "%d - %s:%d%s\n" % (self.number, self.filename, self.line, self.format_state())
 
 
 class GDBWatch(GDBBreakpoint):
-    def __init__(self, exp):
+    def __init__(self, exp, insert=True):
         self.exp = exp
-        super(GDBWatch, self).__init__(None, -1)
+        super(GDBWatch, self).__init__(None, -1, insert)
 
-    def insert(self):
-        out = run_cmd("-break-watch %s" % self.exp, True)
+    def insert_cmd(self):
+        return "-break-watch %s" % self.exp
+
+    def inserted(self, out):
         res = parse_result_line(out)
         if get_result(out) == "error":
             return
+        if self.inserted_after_removal(res["wpt"]["number"]):
+            return
 
-        self.number = int(res["wpt"]["number"])
+        self.set_number(int(res["wpt"]["number"]))
+        if len(self.condition) > 0:
+            self.set_condition(self.condition)
+        if self.ignore_count > 0:
+            self.set_ignore_count(self.ignore_count)
+        gdb_breakpoint_view.schedule_update()
+
+    def breakpoint_added(self, bps):
+        bp = listify(bps)[0]
+        self.set_number(int(bp["number"]))
+        self.update_state(bp)
+
+    def get_store_data(self):
+        data = super(GDBWatch, self).get_store_data()
+        del data["file"]
+        del data["line"]
+        if len(data) == 0:
+            return self.exp
+        data["exp"] = self.exp
+        return data
 
     def format(self):
-        return "%d - watch: %s\n" % (self.number, self.exp)
+        return "%d - watch: %s%s\n" % (self.number, self.exp, self.format_state())
+
+
+def split_arguments(args):
+    # Splits a comma separated argument list, leaving commas inside
+    # of strings, parentheses and brackets alone
+    out = []
+    depth = 0
+    quote = None
+    start = 0
+    i = 0
+    while i < len(args):
+        c = args[i]
+        if quote != None:
+            if c == "\\":
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c == "\"" or c == "'":
+            quote = c
+        elif c in "([{":
+            depth += 1
+        elif c in ")]}":
+            depth -= 1
+        elif c == "," and depth == 0:
+            out.append(args[start:i].strip())
+            start = i + 1
+        i += 1
+    if len(args[start:].strip()) > 0:
+        out.append(args[start:].strip())
+    return out
+
+
+def mi_quote(s):
+    return "\"%s\"" % s.replace("\\", "\\\\").replace("\"", "\\\"")
+
+
+gdb_logpoint_count = 0
+
+
+class GDBLogpoint(GDBBreakpoint):
+    def __init__(self, filename, line, message, insert=True):
+        global gdb_logpoint_count
+        gdb_logpoint_count += 1
+        self.id = gdb_logpoint_count
+        self.message = message
+        self.hits = 0
+        self.bytes = 0
+        self.rate = 0.0
+        self.rate_hits = 0
+        self.rate_start = time.time()
+        gdb_logpoint_view.logpoints[self.id] = self
+        super(GDBLogpoint, self).__init__(filename, line, insert)
+
+    def get_format(self):
+        # message is in the same form as for the dprintf command,
+        # i.e. "format", arg1, arg2. A message without quotes is used
+        # as the format string as is.
+        message = self.message.strip()
+        if message.startswith("\""):
+            end = 1
+            while end < len(message) and message[end] != "\"":
+                if message[end] == "\\":
+                    end += 1
+                end += 1
+            fmt = message[1:end]
+            args = split_arguments(message[end + 1:].lstrip(" ,"))
+        else:
+            fmt = message.replace("\\", "\\\\").replace("\"", "\\\"")
+            args = []
+        if not fmt.endswith("\\n"):
+            fmt += "\\n"
+        # The tag is how the output is told apart from other console output
+        return "\"[logpoint %d] %s\"" % (self.id, fmt), args
+
+    def insert_cmd(self):
+        fmt, args = self.get_format()
+        cmd = "-dprintf-insert %s %s %s" % (self.get_insert_options(), self.get_location(), fmt)
+        for arg in args:
+            cmd += " %s" % mi_quote(arg)
+        return cmd
+
+    def hit(self, size):
+        self.hits += 1
+        self.bytes += size
+
+    def get_rate(self):
+        now = time.time()
+        if now - self.rate_start >= 1.0:
+            self.rate = (self.hits - self.rate_hits) / (now - self.rate_start)
+            self.rate_hits = self.hits
+            self.rate_start = now
+        return self.rate
+
+    def get_store_data(self):
+        data = super(GDBLogpoint, self).get_store_data()
+        data["logpoint"] = self.message
+        return data
 
+    def format(self):
+        return "%d - %s:%d log: %s%s hits: %d (%.1f/s), %d bytes logged\n" % \
+                (self.number, self.filename, self.line, self.message, self.format_state(),
+                 self.hits, self.get_rate(), self.bytes)
 
-class GDBBreakpointView(GDBView):
-    def __init__(self):
-        super(GDBBreakpointView, self).__init__("GDB Breakpoints", s=False, settingsprefix="breakpoints")
-        self.breakpoints = []
+
+class GDBTracepoint(GDBBreakpoint):
+    def insert_cmd(self):
+        return "-break-insert -a %s %s" % (self.get_insert_options(), self.get_location())
+
+    def inserted(self, out):
+        super(GDBTracepoint, self).inserted(out)
+        if self.number != -1:
+            collect = get_list_setting("tracepoint_collect", ["$regs", "$args", "$locals"])
+            run_cmd("-break-commands %d %s" % (self.number, mi_quote("collect %s" % ", ".join(collect))))
+
+    def get_store_data(self):
+        data = super(GDBTracepoint, self).get_store_data()
+        data["tracepoint"] = True
+        return data
+
+    def format(self):
+        return "%d - %s:%d trace%s\n" % (self.number, self.filename, self.line, self.format_state())
+
+
+class GDBBreakpointTransaction:
+    def __init__(self):
+        self.inserts = []
+        self.deletes = []
+        self.commands = []
+        self.depth = 0
+
+    def commit(self):
+        if not is_running() or (len(self.inserts) == 0 and len(self.deletes) == 0 and len(self.commands) == 0):
+            return
+        # Interrupts the inferior once for all the changes. Nothing is
+        # waited on, the breakpoints are updated as the results come in.
+        res = wait_until_stopped()
+        for bkpt in self.inserts:
+            run_cmd(bkpt.insert_cmd(), callback=bkpt.inserted)
+        if len(self.deletes) > 0:
+            run_cmd("-break-delete %s" % " ".join([str(n) for n in self.deletes]))
+        for cmd in self.commands:
+            run_cmd(cmd, callback=lambda out: gdb_breakpoint_view.schedule_update())
+        if res:
+            resume()
+
+
+class GDBBreakpointView(GDBView):
+    def __init__(self):
+        super(GDBBreakpointView, self).__init__("GDB Breakpoints", s=False, settingsprefix="breakpoints")
+        self.breakpoints = []
+        # Breakpoints by normalized filename and by (filename, line)
+        self.files = {}
+        self.locations = {}
+        self.numbers = {}
+        self.transaction = None
+        self.update_pending = False
+        self.loaded = False
+        self.save_pending = False
+        self.store = None
+        # window id -> (folders, store path), see get_store_path
+        self.store_paths = {}
+        self.marked = {}
+        # Logpoint number -> latest =breakpoint-modified, see
+        # logpoint_modified
+        self.modified_lock = threading.Lock()
+        self.modified = {}
+        self.modified_pending = False
 
     def open(self):
         super(GDBBreakpointView, self).open()
@@ -1016,60 +2073,364 @@ class GDBBreakpointView(GDBView):
         for bkpt in self.breakpoints:
             bkpt.clear()
 
+    def get_store_path(self):
+        # load() runs on every stop, so the path is only worked out
+        # again once the window's folders or the settings change
+        window = sublime.active_window()
+        id = window.id() if window != None else None
+        if id not in self.store_paths:
+            folders = window.folders() if window != None else []
+            self.store_paths[id] = (folders, self.find_store_path(window, folders))
+        return self.store_paths[id][1]
+
+    def find_store_path(self, window, folders):
+        path = get_setting("breakpoint_store")
+        if path != None:
+            return expand_path(path, window)
+        key = hashlib.md5("\n".join(sorted(folders)).encode("utf-8")).hexdigest()
+        return os.path.join(sublime.packages_path(), "User", "SublimeGDB", "breakpoints-%s.json" % key)
+
+    def window_activated(self, window):
+        if window != None and window.id() in self.store_paths:
+            if self.store_paths[window.id()][0] != window.folders():
+                del self.store_paths[window.id()]
+
+    def load(self):
+        # Every window's set of folders has a store of its own, the
+        # breakpoints are swapped out when another project's window
+        # is used. During a session they stay with the session.
+        path = self.get_store_path()
+        if self.loaded and (path == self.store or is_running()):
+            return
+        if self.loaded:
+            self.unload()
+            self.schedule_update()
+        self.loaded = True
+        self.store = path
+        if not os.path.exists(self.store):
+            return
+        try:
+            f = open(self.store)
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+            for item in data.get("breakpoints", []):
+                if "logpoint" in item:
+                    bkpt = GDBLogpoint(item["file"], item["line"], item["logpoint"], insert=False)
+                elif "tracepoint" in item:
+                    bkpt = GDBTracepoint(item["file"], item["line"], insert=False)
+                else:
+                    bkpt = GDBBreakpoint(item["file"], item["line"], insert=False)
+                bkpt.last_resolved = item.get("resolved")
+                self.load_options(bkpt, item)
+                self.add_breakpoint(bkpt, save=False)
+                bkpt.add()
+            for item in data.get("watches", []):
+                if isinstance(item, dict):
+                    bkpt = GDBWatch(item["exp"], insert=False)
+                    self.load_options(bkpt, item)
+                else:
+                    bkpt = GDBWatch(item, insert=False)
+                self.add_breakpoint(bkpt, save=False)
+                bkpt.add()
+            gdb_watch_view.load(data.get("expressions", []))
+        except:
+            traceback.print_exc()
+
+    def unload(self):
+        if self.save_pending:
+            self.save()
+        for bkpt in self.breakpoints:
+            if isinstance(bkpt, GDBLogpoint):
+                del gdb_logpoint_view.logpoints[bkpt.id]
+        self.breakpoints = []
+        self.files = {}
+        self.locations = {}
+        self.numbers = {}
+        self.marked = {}
+        gdb_watch_view.load([])
+
+    def load_options(self, bkpt, item):
+        bkpt.condition = item.get("condition", "")
+        bkpt.ignore_count = item.get("ignore", 0)
+        bkpt.temporary = item.get("temporary", False)
+
+    def schedule_save(self):
+        if self.loaded and not self.save_pending:
+            self.save_pending = True
+            sublime.set_timeout(self.save, 1000)
+
+    def save(self):
+        self.save_pending = False
+        data = {"breakpoints": [], "watches": [], "expressions": gdb_watch_view.get_store_data()}
+        for bkpt in self.breakpoints:
+            if isinstance(bkpt, GDBWatch):
+                data["watches"].append(bkpt.get_store_data())
+            else:
+                data["breakpoints"].append(bkpt.get_store_data())
+        try:
+            if not os.path.exists(os.path.dirname(self.store)):
+                os.makedirs(os.path.dirname(self.store))
+            f = open(self.store, "w")
+            try:
+                json.dump(data, f, indent=4)
+            finally:
+                f.close()
+        except:
+            traceback.print_exc()
+
+    def update_lines(self, view):
+        # Follows the breakpoint markers when lines are added or
+        # removed above them so that the breakpoints stay on the
+        # same code.
+        fn = view.file_name()
+        if fn == None:
+            return
+        fn = normalize(fn)
+        marked = self.marked.get(fn)
+        if not marked:
+            return
+        regions = view.get_regions("sublimegdb.breakpoints")
+        if len(regions) != len(marked):
+            return
+        changed = False
+        for bkpt, region in zip(marked, regions):
+            delta = view.rowcol(region.begin())[0] + 1 - bkpt.line
+            if delta != 0:
+                bkpt.shift(fn, delta)
+                changed = True
+        if changed:
+            self.schedule_save()
+            self.update_view()
+
     def update_marker(self, view):
+        self.load()
         bps = []
         fn = view.file_name()
         if fn == None:
             return
         fn = normalize(fn)
-        for bkpt in self.breakpoints:
-            if bkpt.filename == fn and not (bkpt.line == gdb_cursor_position and fn == gdb_cursor):
+        marked = []
+        for bkpt in sorted(self.files.get(fn, []), key=lambda b: b.line):
+            if not (bkpt.line == gdb_cursor_position and fn == gdb_cursor):
                 bps.append(view.full_line(view.text_point(bkpt.line - 1, 0)))
+                marked.append(bkpt)
+        self.marked[fn] = marked
 
         view.add_regions("sublimegdb.breakpoints", bps,
                             get_setting("breakpoint_scope", "keyword.gdb"),
                             get_setting("breakpoint_icon", "circle"),
                             sublime.HIDDEN)
 
-    def find_breakpoint(self, filename, line):
-        filename = normalize(filename)
-        for bkpt in self.breakpoints:
-            if bkpt.filename == filename and bkpt.line == line:
-                return bkpt
+    def begin(self):
+        if self.transaction == None:
+            self.transaction = GDBBreakpointTransaction()
+        self.transaction.depth += 1
+
+    def commit(self):
+        self.transaction.depth -= 1
+        if self.transaction.depth == 0:
+            t = self.transaction
+            self.transaction = None
+            t.commit()
+            update_view_markers()
+            self.update_view()
+
+    def queue_insert(self, bkpt):
+        self.begin()
+        self.transaction.inserts.append(bkpt)
+        self.commit()
+
+    def queue_command(self, cmd):
+        if not is_running():
+            return
+        self.begin()
+        self.transaction.commands.append(cmd)
+        self.commit()
+
+    def queue_delete(self, bkpt):
+        self.begin()
+        if bkpt in self.transaction.inserts:
+            self.transaction.inserts.remove(bkpt)
+        elif bkpt.number != -1:
+            self.transaction.deletes.append(bkpt.number)
+        self.commit()
+
+    def index(self, bkpt):
+        bkpt.key = (bkpt.filename, bkpt.line)
+        if bkpt.key[0] == None:
+            return
+        if bkpt.key[0] not in self.files:
+            self.files[bkpt.key[0]] = []
+        self.files[bkpt.key[0]].append(bkpt)
+        if bkpt.key not in self.locations:
+            self.locations[bkpt.key] = bkpt
+
+    def unindex(self, bkpt):
+        key = bkpt.key
+        bkpt.key = None
+        if key == None or key[0] == None:
+            return
+        same = self.files[key[0]]
+        same.remove(bkpt)
+        if len(same) == 0:
+            del self.files[key[0]]
+        if self.locations.get(key) is bkpt:
+            del self.locations[key]
+            for other in same:
+                if other.line == key[1]:
+                    self.locations[key] = other
+                    break
+
+    def reindex(self, bkpt):
+        if bkpt.key != None and bkpt.key != (bkpt.filename, bkpt.line):
+            self.unindex(bkpt)
+            self.index(bkpt)
+            self.schedule_save()
+
+    def add_breakpoint(self, bkpt, save=True):
+        self.breakpoints.append(bkpt)
+        self.index(bkpt)
+        if save:
+            self.schedule_save()
+
+    def remove_breakpoint(self, bkpt, delete=True):
+        if delete:
+            bkpt.remove()
+        if isinstance(bkpt, GDBLogpoint):
+            del gdb_logpoint_view.logpoints[bkpt.id]
+        self.breakpoints.remove(bkpt)
+        self.unindex(bkpt)
+        bkpt.removed = True
+        bkpt.set_number(-1)
+        self.schedule_save()
+
+    def renumber(self, bkpt, number):
+        if self.numbers.get(bkpt.number) is bkpt:
+            del self.numbers[bkpt.number]
+        bkpt.number = number
+        if number != -1:
+            self.numbers[number] = bkpt
+
+    def create_breakpoint(self, bp):
+        if "type" not in bp:
+            return None
+        if bp["type"] == "breakpoint" and "fullname" in bp and "line" in bp:
+            return GDBBreakpoint(bp["fullname"], int(bp["line"]), insert=False)
+        elif bp["type"].endswith("watchpoint") and "what" in bp:
+            return GDBWatch(bp["what"], insert=False)
+        elif bp["type"] == "tracepoint" and "fullname" in bp and "line" in bp:
+            return GDBTracepoint(bp["fullname"], int(bp["line"]), insert=False)
         return None
 
+    def logpoint_modified(self, number, res):
+        # Called from the GDBSession reader thread. Every dprintf hit
+        # bumps the hit count with a =breakpoint-modified, so only the
+        # latest one of each logpoint is applied, at most once a second
+        self.modified_lock.acquire()
+        try:
+            self.modified[number] = res
+            if self.modified_pending:
+                return
+            self.modified_pending = True
+        finally:
+            self.modified_lock.release()
+        sublime.set_timeout(self.apply_modified, 1000)
+
+    def apply_modified(self):
+        self.modified_lock.acquire()
+        try:
+            modified = self.modified
+            self.modified = {}
+            self.modified_pending = False
+        finally:
+            self.modified_lock.release()
+        for res in modified.values():
+            self.breakpoint_notification("breakpoint-modified", res, 1000)
+
+    def breakpoint_notification(self, cls, res, delay=100):
+        if cls == "breakpoint-deleted":
+            bkpt = self.numbers.get(int(res["id"]))
+            if bkpt != None:
+                self.remove_breakpoint(bkpt, delete=False)
+        else:
+            bps = listify(res["bkpt"])
+            bkpt = self.numbers.get(int(bps[0]["number"]))
+            if bkpt == None:
+                if cls != "breakpoint-created":
+                    return
+                # Created by something else than us, for example
+                # with the break command in the console
+                bkpt = self.create_breakpoint(bps[0])
+                if bkpt == None:
+                    return
+                self.add_breakpoint(bkpt)
+            bkpt.breakpoint_added(bps)
+        self.schedule_update(delay)
+
+    def schedule_update(self, delay=100):
+        if not self.update_pending:
+            self.update_pending = True
+            sublime.set_timeout(self.scheduled_update, delay)
+
+    def scheduled_update(self):
+        self.update_pending = False
+        update_view_markers()
+        self.update_view()
+
+    def find_breakpoint(self, filename, line):
+        self.load()
+        return self.locations.get((normalize(filename), line))
+
     def toggle_watch(self, exp):
+        self.load()
         add = True
         for bkpt in self.breakpoints:
             if isinstance(bkpt, GDBWatch) and bkpt.exp == exp:
                 add = False
-                bkpt.remove()
-                self.breakpoints.remove(bkpt)
+                self.remove_breakpoint(bkpt)
                 break
 
         if add:
-            self.breakpoints.append(GDBWatch(exp))
+            self.add_breakpoint(GDBWatch(exp))
         self.update_view()
 
     def toggle_breakpoint(self, filename, line):
         bkpt = self.find_breakpoint(filename, line)
         if bkpt:
-            bkpt.remove()
-            self.breakpoints.remove(bkpt)
+            self.remove_breakpoint(bkpt)
         else:
-            self.breakpoints.append(GDBBreakpoint(filename, line))
+            self.add_breakpoint(GDBBreakpoint(filename, line))
+        self.update_view()
+
+    def toggle_tracepoint(self, filename, line):
+        bkpt = self.find_breakpoint(filename, line)
+        if bkpt:
+            self.remove_breakpoint(bkpt)
+        if not isinstance(bkpt, GDBTracepoint):
+            # Other breakpoints on the line are turned into a tracepoint
+            self.add_breakpoint(GDBTracepoint(filename, line))
+        self.update_view()
+
+    def add_logpoint(self, filename, line, message):
+        bkpt = self.find_breakpoint(filename, line)
+        if bkpt:
+            self.remove_breakpoint(bkpt)
+        self.add_breakpoint(GDBLogpoint(filename, line, message))
         self.update_view()
 
     def sync_breakpoints(self):
-        global breakpoints
+        self.load()
+        self.begin()
         for bkpt in self.breakpoints:
             bkpt.add()
-        update_view_markers()
-        self.update_view()
+        self.commit()
 
     def update_view(self):
         if not self.is_open():
             return
+        self.load()
         pos = self.get_view().viewport_position()
         self.clear()
         self.breakpoints.sort(key=lambda b: (b.number, b.filename, b.line))
@@ -1079,6 +2440,530 @@ class GDBBreakpointView(GDBView):
         self.update()
 
 
+class GDBLogpointView(GDBView):
+    def __init__(self):
+        super(GDBLogpointView, self).__init__("GDB Logpoints", settingsprefix="logpoints")
+        self.logpoints = {}
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.flush_pending = False
+
+    def log(self, text):
+        # Called from the GDBSession reader thread for every logpoint hit, so
+        # the output is buffered and written out in batches
+        end = text.find("]")
+        id = int(text[len("[logpoint "):end])
+        if id in self.logpoints:
+            self.logpoints[id].hit(len(text))
+            gdb_breakpoint_view.schedule_update(1000)
+        if self.is_open():
+            self.lock.acquire()
+            try:
+                self.buffer.append(text[end + 2:])
+                schedule = not self.flush_pending
+                self.flush_pending = True
+            finally:
+                self.lock.release()
+            if schedule:
+                sublime.set_timeout(self.flush, 50)
+
+    def flush(self):
+        self.lock.acquire()
+        try:
+            self.flush_pending = False
+            buffer = self.buffer
+            self.buffer = []
+        finally:
+            self.lock.release()
+        self.add_line("".join(buffer), True)
+
+
+def parse_address(value):
+    addr = re.search("0x[0-9a-fA-F]+", value)
+    if addr != None:
+        return int(addr.group(0), 16)
+    return int(value.split(" ")[0])
+
+
+def read_memory_result(line, size):
+    # Returns a list with one entry per byte, None for the bytes
+    # gdb couldn't read
+    data = [None] * size
+    if get_result(line) == "error":
+        return data
+    res = parse_result_line(line)
+    if "memory" not in res:
+        return data
+    for block in listify(res["memory"]):
+        offset = int(block["offset"], 16)
+        contents = block["contents"].decode("hex")
+        for i in range(min(len(contents), size - offset)):
+            data[offset + i] = ord(contents[i])
+    return data
+
+
+def format_memory_row(addr, data):
+    hex = ""
+    ascii = ""
+    for b in data:
+        if b == None:
+            hex += "?? "
+            ascii += "?"
+        else:
+            hex += "%02x " % b
+            ascii += chr(b) if b >= 32 and b < 127 else "."
+    return "0x%016x: %s |%s|\n" % (addr, hex, ascii)
+
+
+class GDBMemoryView(GDBView):
+    def __init__(self):
+        super(GDBMemoryView, self).__init__("GDB Memory", s=False, settingsprefix="memory")
+        self.address = None
+        # page address -> (stop epoch, bytes), least recently used first
+        self.pages = collections.OrderedDict()
+        self.shown = []
+        self.rendered = {}
+
+    def open(self):
+        super(GDBMemoryView, self).open()
+        self.get_view().settings().set("word_wrap", False)
+        if self.is_open() and gdb_run_status == "stopped":
+            self.update_memory()
+
+    def get_page_size(self):
+        return max(16, get_int_setting("memory_page_size", 256) / 16 * 16)
+
+    def set_address(self, addr):
+        self.address = addr - addr % self.get_page_size()
+        self.shown = []
+        self.update_memory()
+
+    def scroll_pages(self, count):
+        if self.address == None:
+            return
+        self.address = max(0, self.address + count * self.get_page_size())
+        self.update_memory()
+
+    def memory_changed(self, res):
+        addr = int(res["addr"], 16)
+        end = addr + int(res["len"], 16)
+        size = self.get_page_size()
+        for page in self.pages.keys():
+            if page < end and page + size > addr:
+                del self.pages[page]
+        self.update_memory()
+
+    def read_pages(self, addrs):
+        size = self.get_page_size()
+        missing = [a for a in addrs if a not in self.pages or self.pages[a][0] != gdb_stop_epoch]
+        results = run_cmds(["-data-read-memory-bytes 0x%x %d" % (a, size) for a in missing])
+        for a, line in zip(missing, results):
+            self.pages.pop(a, None)
+            self.pages[a] = (gdb_stop_epoch, read_memory_result(line, size))
+        data = []
+        for a in addrs:
+            # Move to the most recently used end
+            page = self.pages.pop(a)
+            self.pages[a] = page
+            data.append(page[1])
+        while len(self.pages) > get_int_setting("memory_cache_pages", 256):
+            self.pages.popitem(last=False)
+        return data
+
+    def format_page(self, addr, data):
+        out = ""
+        for i in range(0, len(data), 16):
+            out += format_memory_row(addr + i, data[i:i + 16])
+        return out
+
+    def catch_up(self):
+        self.update_memory()
+
+    def update_memory(self):
+        if not self.should_update() or self.address == None:
+            return
+        size = self.get_page_size()
+        count = max(1, get_int_setting("memory_rows", 64) * 16 / size)
+        addrs = [self.address + i * size for i in range(count)]
+        pages = self.read_pages(addrs)
+
+        if addrs != self.shown:
+            pos = (0, 0) if len(self.shown) == 0 else self.get_view().viewport_position()
+            self.clear()
+            self.add_line("".join([self.format_page(a, p) for a, p in zip(addrs, pages)]))
+            self.set_viewport_position(pos)
+        else:
+            # Only the pages whose contents changed are re-rendered
+            rows = size / 16
+            for i in range(count):
+                if pages[i] != self.rendered[addrs[i]]:
+                    self.replace_lines(i * rows, (i + 1) * rows, self.format_page(addrs[i], pages[i]))
+        self.shown = addrs
+        self.rendered = dict(zip(addrs, pages))
+        self.update()
+
+    def on_session_ended(self):
+        super(GDBMemoryView, self).on_session_ended()
+        self.pages.clear()
+        self.shown = []
+        self.rendered = {}
+
+
+def read_memory_block(line, size):
+    if get_result(line) == "error":
+        return None
+    res = parse_result_line(line)
+    if "memory" not in res:
+        return None
+    blocks = listify(res["memory"])
+    if len(blocks) != 1 or int(blocks[0]["offset"], 16) != 0:
+        # Partially readable, treated as unreadable
+        return None
+    data = blocks[0]["contents"].decode("hex")
+    return data if len(data) == size else None
+
+
+class GDBMemoryRegion:
+    def __init__(self, exp, addr, length):
+        self.exp = exp
+        self.addr = addr
+        self.length = length
+        # The last snapshot, one string of bytes per block, and the
+        # stop it was taken at
+        self.blocks = None
+        self.blocksize = 0
+        self.epoch = -1
+        # row offset -> offsets of the changed bytes in that row
+        self.rows = {}
+        self.changed_bytes = 0
+        self.changed_blocks = 0
+
+    def snapshot(self, epoch, blocksize, batch, maxrows):
+        # Runs outside of the main thread. gdb has no way of telling
+        # which memory changed, so every block is read again, but
+        # only the blocks that differ are compared byte by byte.
+        if self.epoch == epoch:
+            return
+        addrs = range(self.addr, self.addr + self.length, blocksize)
+        blocks = []
+        for i in range(0, len(addrs), batch):
+            chunk = addrs[i:i + batch]
+            sizes = [min(blocksize, self.addr + self.length - a) for a in chunk]
+            results = run_cmds(["-data-read-memory-bytes 0x%x %d" % (a, size) for a, size in zip(chunk, sizes)], timeout=60)
+            for line, size in zip(results, sizes):
+                blocks.append(read_memory_block(line, size))
+        if epoch != gdb_stop_epoch:
+            # The program ran on while reading, so the blocks are from
+            # no single stop and diffing them would show bogus changes
+            return
+
+        rows = {}
+        changed_bytes = 0
+        changed_blocks = 0
+        if self.blocks != None and self.blocksize == blocksize:
+            for i in range(len(blocks)):
+                old = self.blocks[i]
+                new = blocks[i]
+                if old == new:
+                    continue
+                changed_blocks += 1
+                base = i * blocksize
+                size = min(blocksize, self.length - base)
+                if old == None or new == None:
+                    offsets = range(size)
+                else:
+                    offsets = [j for j in xrange(size) if old[j] != new[j]]
+                changed_bytes += len(offsets)
+                for j in offsets:
+                    row = (base + j) / 16 * 16
+                    if row not in rows:
+                        if len(rows) >= maxrows:
+                            continue
+                        rows[row] = []
+                    rows[row].append(base + j - row)
+        self.blocks = blocks
+        self.blocksize = blocksize
+        self.epoch = epoch
+        self.rows = rows
+        self.changed_bytes = changed_bytes
+        self.changed_blocks = changed_blocks
+
+    def get_row(self, row):
+        data = []
+        for offset in range(row, min(row + 16, self.length)):
+            block = self.blocks[offset / self.blocksize]
+            data.append(ord(block[offset % self.blocksize]) if block != None else None)
+        return data
+
+    def format_header(self):
+        out = "%s: 0x%x, %d bytes" % (self.exp, self.addr, self.length)
+        if self.changed_bytes > 0:
+            out += ", %d bytes changed in %d blocks" % (self.changed_bytes, self.changed_blocks)
+        return out + "\n"
+
+
+class GDBMemoryDiffView(GDBView):
+    def __init__(self):
+        super(GDBMemoryDiffView, self).__init__("GDB Memory Diff", s=False, settingsprefix="memorydiff")
+        self.regions = []
+        self.epoch = -1
+        self.busy = False
+        self.pending = False
+
+    def open(self):
+        super(GDBMemoryDiffView, self).open()
+        self.get_view().settings().set("word_wrap", False)
+        self.render()
+
+    def pin(self, exp, addr, length):
+        self.regions.append(GDBMemoryRegion(exp, addr, length))
+        self.update_snapshots()
+
+    def unpin(self, idx):
+        del self.regions[idx]
+        self.render()
+
+    def update_snapshots(self):
+        # Unlike the other views the snapshots are always taken, even
+        # when hidden, or the changes between two stops would be lost
+        if not is_running() or len(self.regions) == 0:
+            return
+        if self.busy:
+            self.pending = True
+            return
+        self.busy = True
+        args = (list(self.regions), gdb_stop_epoch,
+                max(16, get_int_setting("memory_diff_block_size", 4096) / 16 * 16),
+                get_int_setting("memory_diff_batch", 16),
+                get_int_setting("memory_diff_max_rows", 256))
+        t = threading.Thread(target=self.do_snapshots, args=args)
+        t.start()
+
+    def do_snapshots(self, regions, epoch, blocksize, batch, maxrows):
+        try:
+            for region in regions:
+                region.snapshot(epoch, blocksize, batch, maxrows)
+        except:
+            traceback.print_exc()
+        sublime.set_timeout(self.snapshots_done, 0)
+
+    def snapshots_done(self):
+        self.busy = False
+        if self.pending:
+            self.pending = False
+            self.update_snapshots()
+            return
+        self.render()
+
+    def render(self):
+        if not self.is_open():
+            return
+        out = ""
+        changed = []
+        line = 0
+        for region in self.regions:
+            out += region.format_header()
+            line += 1
+            if region.blocks == None:
+                continue
+            for row in sorted(region.rows.keys()):
+                out += "  " + format_memory_row(region.addr + row, region.get_row(row))
+                changed.append((line, region.rows[row]))
+                line += 1
+        self.clear(True)
+        self.add_line(out, True)
+
+        v = self.get_view()
+        regions = []
+        for line, cols in changed:
+            start = v.text_point(line, 0)
+            for col in cols:
+                # Two spaces of indent, then "0x%016x: " before the hex bytes
+                begin = start + 2 + 20 + col * 3
+                regions.append(sublime.Region(begin, begin + 2))
+        v.add_regions("sublimegdb.dirtymemory", regions,
+                        get_setting("changed_variable_scope", "entity.name.class"),
+                        "", sublime.DRAW_OUTLINED)
+
+    def on_session_ended(self):
+        super(GDBMemoryDiffView, self).on_session_ended()
+        # The addresses mean nothing in the next session
+        self.regions = []
+        self.pending = False
+
+
+class GDBWatchView(GDBView):
+    def __init__(self):
+        super(GDBWatchView, self).__init__("GDB Watch", False, settingsprefix="watch")
+        # List of (expression, frozen)
+        self.expressions = []
+        # expression -> GDBVariable, or the error message
+        self.variables = {}
+        self.evaluated = None
+
+    def open(self):
+        super(GDBWatchView, self).open()
+        self.set_syntax("Packages/C++/C++.tmLanguage")
+        self.update_view()
+        if self.is_open() and gdb_run_status == "stopped":
+            self.update_watches()
+
+    def get_store_data(self):
+        return [exp if not frozen else {"exp": exp, "frozen": True} for exp, frozen in self.expressions]
+
+    def load(self, data):
+        self.expressions = []
+        for item in data:
+            if isinstance(item, dict):
+                self.expressions.append((item["exp"], item.get("frozen", False)))
+            else:
+                self.expressions.append((item, False))
+
+    def add_expression(self, exp):
+        if exp in [e for e, frozen in self.expressions]:
+            return
+        self.expressions.append((exp, False))
+        gdb_breakpoint_view.schedule_save()
+        if self.is_open() and is_running() and gdb_run_status == "stopped":
+            self.create_variable(exp, False)
+        self.update_view()
+
+    def remove_expression(self, idx):
+        exp, frozen = self.expressions.pop(idx)
+        var = self.variables.pop(exp, None)
+        if isinstance(var, GDBVariable) and is_running():
+            var.delete()
+        gdb_breakpoint_view.schedule_save()
+        self.update_view()
+
+    def toggle_frozen(self, idx):
+        exp, frozen = self.expressions[idx]
+        self.expressions[idx] = (exp, not frozen)
+        var = self.variables.get(exp)
+        if isinstance(var, GDBVariable) and is_running():
+            run_cmd("-var-set-frozen %s %d" % (var.get_name(), 0 if frozen else 1))
+        gdb_breakpoint_view.schedule_save()
+        self.update_view()
+
+    def create_variable(self, exp, frozen):
+        # A floating varobj, evaluated in whatever frame is selected
+        line = run_cmd("-var-create - @ %s" % mi_quote(exp), True)
+        if get_result(line) == "error":
+            self.variables[exp] = line[line.find("msg=") + 4:].strip("\"")
+            return
+        var = parse_result_line(line)
+        var["exp"] = exp
+        self.variables[exp] = GDBVariable(var)
+        if frozen:
+            run_cmd("-var-set-frozen %s 1" % var["name"])
+
+    def apply_changes(self, changes):
+        for var in self.variables.values():
+            if isinstance(var, GDBVariable):
+                var.clear_dirty()
+        for value in changes:
+            name = value["name"]
+            for exp, var in self.variables.items():
+                if not isinstance(var, GDBVariable):
+                    continue
+                real = var.find(name)
+                if real == None:
+                    continue
+                if "in_scope" in value and value["in_scope"] == "invalid":
+                    # Recreated on the next update
+                    del self.variables[exp]
+                elif "in_scope" in value and value["in_scope"] == "false":
+                    real["value"] = "<not in scope>"
+                else:
+                    real.update(value)
+                break
+
+    def catch_up(self):
+        self.update_watches()
+
+    def update_watches(self, frozen=False):
+        if not self.should_update():
+            return
+        for exp, isfrozen in self.expressions:
+            var = self.variables.get(exp)
+            if var == None or (not isinstance(var, GDBVariable) and not isfrozen):
+                self.create_variable(exp, isfrozen)
+        # Still the same stop, but the watches are evaluated in another
+        # thread or frame so the shared update can't be reused
+        evaluated = (gdb_stop_epoch, gdb_cursor_thread, gdb_stack_index)
+        update_varobjs(self.evaluated != None and self.evaluated[0] == evaluated[0] and self.evaluated != evaluated)
+        self.evaluated = evaluated
+        if frozen:
+            # Frozen varobjs are skipped by "-var-update *" and only
+            # updated when asked for explicitly
+            names = [self.variables[exp].get_name() for exp, isfrozen in self.expressions
+                     if isfrozen and isinstance(self.variables.get(exp), GDBVariable)]
+            changes = []
+            for line in run_cmds(["-var-update --all-values %s" % name for name in names]):
+                if get_result(line) != "error":
+                    ret = parse_result_line(line)["changelist"]
+                    changes.extend(listify(ret["varobj"]) if "varobj" in ret else ret)
+            self.apply_changes(changes)
+        self.update_view()
+
+    def update_view(self):
+        if not self.is_open():
+            return
+        self.clear()
+        output = ""
+        line = 0
+        dirtylist = []
+        for exp, frozen in self.expressions:
+            var = self.variables.get(exp)
+            if isinstance(var, GDBVariable):
+                out, line = var.format(line=line, dirty=dirtylist)
+            else:
+                out = " %s = <%s>\n" % (exp, var if var != None else "not evaluated")
+                line += 1
+            if frozen:
+                out = out.replace("\n", " (frozen)\n", 1)
+            output += out
+        self.add_line(output)
+        self.update()
+        regions = []
+        v = self.get_view()
+        for dirty in dirtylist:
+            regions.append(v.full_line(v.text_point(dirty.line, 0)))
+        v.add_regions("sublimegdb.dirtywatches", regions,
+                        get_setting("changed_variable_scope", "entity.name.class"),
+                        get_setting("changed_variable_icon", ""),
+                        sublime.DRAW_OUTLINED)
+
+    def on_session_ended(self):
+        self.dirty = False
+        self.variables = {}
+        self.evaluated = None
+        self.update_view()
+
+
+class GDBStatsView(GDBView):
+    def __init__(self):
+        super(GDBStatsView, self).__init__("GDB Stats", s=False, settingsprefix="stats")
+
+    def open(self):
+        super(GDBStatsView, self).open()
+        self.get_view().settings().set("word_wrap", False)
+        self.render()
+
+    def render(self):
+        if not self.is_visible():
+            return
+        self.clear(True)
+        self.add_line(gdb_stats.format(), True)
+
+    def on_activated(self):
+        self.render()
+
+    def on_session_ended(self):
+        # Kept around to be looked at after the session
+        pass
+
+
 class GDBSessionView(GDBView):
     def __init__(self):
         super(GDBSessionView, self).__init__("GDB Session", s=False, settingsprefix="session")
@@ -1096,7 +2981,13 @@ gdb_register_view = GDBRegisterView()
 gdb_disassembly_view = GDBDisassemblyView()
 gdb_threads_view = GDBThreadsView()
 gdb_breakpoint_view = GDBBreakpointView()
-gdb_views = [gdb_session_view, gdb_console_view, gdb_variables_view, gdb_callstack_view, gdb_register_view, gdb_disassembly_view, gdb_threads_view, gdb_breakpoint_view]
+gdb_unique_stacks_view = GDBUniqueStacksView()
+gdb_logpoint_view = GDBLogpointView()
+gdb_memory_view = GDBMemoryView()
+gdb_memory_diff_view = GDBMemoryDiffView()
+gdb_watch_view = GDBWatchView()
+gdb_stats_view = GDBStatsView()
+gdb_views = [gdb_session_view, gdb_console_view, gdb_variables_view, gdb_callstack_view, gdb_register_view, gdb_disassembly_view, gdb_threads_view, gdb_breakpoint_view, gdb_unique_stacks_view, gdb_logpoint_view, gdb_memory_view, gdb_memory_diff_view, gdb_watch_view, gdb_stats_view]
 
 
 def update_view_markers(view=None):
@@ -1122,35 +3013,15 @@ def update_view_markers(view=None):
     gdb_threads_view.update_marker(pos_scope, pos_icon)
     gdb_breakpoint_view.update_marker(view)
 
-count = 0
+gdb_session = gdbengine.GDBSession(parse_result_line, lambda f: sublime.set_timeout(f, 0))
 
 
-def run_cmd(cmd, block=False, mimode=True, timeout=10):
-    global count
-    if not is_running():
-        return "0^error,msg=\"no session running\""
+def run_cmd(cmd, block=False, mimode=True, timeout=10, callback=None):
+    return gdb_session.run_cmd(cmd, block, mimode, timeout, callback)
 
-    timeoutcount = timeout/0.001
 
-    if mimode:
-        count = count + 1
-        cmd = "%d%s\n" % (count, cmd)
-    else:
-        cmd = "%s\n\n" % cmd
-    log_debug(cmd)
-    if gdb_session_view != None:
-        gdb_session_view.add_line(cmd)
-    gdb_process.stdin.write(cmd)
-    if block:
-        countstr = "%d^" % count
-        i = 0
-        while not gdb_lastresult.startswith(countstr) and i < timeoutcount:
-            i += 1
-            time.sleep(0.001)
-        if i >= timeoutcount:
-            raise ValueError("Command \"%s\" took longer than %d seconds to perform?" % (cmd, timeout))
-        return gdb_lastresult
-    return count
+def run_cmds(cmds, timeout=10):
+    return gdb_session.run_cmds(cmds, timeout)
 
 
 def wait_until_stopped():
@@ -1174,8 +3045,129 @@ def resume():
     run_cmd("-exec-continue", True)
 
 
-def get_result(line):
-    return result_regex.search(line).group(0)
+def step(cmd):
+    global gdb_stepping
+    global gdb_step_trail
+    global gdb_step_cmd
+    gdb_step_lock.acquire()
+    try:
+        if gdb_stepping:
+            if len(gdb_step_queue) < get_int_setting("step_queue_max", 50):
+                gdb_step_queue.append(cmd)
+            sublime.status_message("%d step(s) queued" % len(gdb_step_queue))
+            return
+        gdb_stepping = True
+        gdb_step_trail = []
+        gdb_step_cmd = cmd
+    finally:
+        gdb_step_lock.release()
+    run_cmd(cmd, callback=step_result)
+
+
+def step_result(line):
+    global gdb_stepping
+    if get_result(line) != "error":
+        return
+    gdb_step_lock.acquire()
+    try:
+        gdb_stepping = False
+        del gdb_step_queue[:]
+    finally:
+        gdb_step_lock.release()
+    sublime.status_message("Error: %s" % line[line.find("msg=") + 4:])
+    if len(gdb_step_trail) > 0:
+        # The stop before this command wasn't rendered
+        update_cursor()
+
+
+def in_skipped_library(frame):
+    if "from" in frame:
+        for pattern in gdb_skip_libraries:
+            if fnmatch.fnmatch(frame["from"], pattern) or \
+                    fnmatch.fnmatch(os.path.basename(frame["from"]), pattern):
+                return True
+    if "addr" not in frame:
+        return False
+    addr = int(frame["addr"], 16)
+    for ranges in gdb_skipped_ranges.values():
+        for low, high in ranges:
+            if addr >= low and addr < high:
+                return True
+    return False
+
+
+def continue_stepping(line):
+    global gdb_stepping
+    global gdb_step_cmd
+    gdb_step_lock.acquire()
+    try:
+        if not gdb_stepping:
+            return False
+        cls, res = parse_async_record(line[line.find("*"):])
+        reason = res.get("reason")
+        frame = res.get("frame", {})
+        if reason == "end-stepping-range" and gdb_step_cmd == "-exec-step" and in_skipped_library(frame):
+            cmd = "-exec-finish"
+        elif reason == "function-finished" and gdb_step_cmd == "-exec-finish":
+            # Back in the caller, but in the middle of the line the
+            # step started from
+            cmd = "-exec-step"
+        elif reason == "end-stepping-range" and len(gdb_step_queue) > 0:
+            cmd = gdb_step_queue.pop(0)
+        else:
+            # Anything other than a plain step, like hitting a
+            # breakpoint, drops the steps that are still queued
+            gdb_stepping = False
+            del gdb_step_queue[:]
+            if len(gdb_step_trail) > 0:
+                msg = "Skipped %d intermediate stop(s)" % len(gdb_step_trail)
+                sublime.set_timeout(lambda: sublime.status_message(msg), 0)
+            return False
+        gdb_step_trail.append((frame.get("func", "??"), frame.get("fullname"), int(frame.get("line", 0))))
+        gdb_step_cmd = cmd
+    finally:
+        gdb_step_lock.release()
+    run_cmd(cmd, callback=step_result)
+    return True
+
+
+def library_loaded(res):
+    name = res.get("target-name", "")
+    for pattern in gdb_skip_libraries:
+        if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(os.path.basename(name), pattern):
+            ranges = []
+            for r in listify(res.get("ranges", [])):
+                if "from" in r and "to" in r:
+                    ranges.append((int(r["from"], 16), int(r["to"], 16)))
+            gdb_skipped_ranges[res.get("id", name)] = ranges
+            break
+
+
+def add_skip(kind, value):
+    if kind == "function name":
+        # An exact name, templates and operators would need escaping
+        # as a regex
+        run_cmd("-interpreter-exec console %s" % mi_quote("skip -fu %s" % mi_quote(value)))
+    elif kind == "function":
+        run_cmd("-interpreter-exec console %s" % mi_quote("skip -rfu %s" % mi_quote(value)))
+    elif kind == "file":
+        run_cmd("-interpreter-exec console %s" % mi_quote("skip -gfi %s" % mi_quote(value)))
+    elif kind == "library":
+        gdb_skip_libraries.append(value)
+
+
+def apply_skips():
+    global gdb_skip_libraries
+    gdb_skip_libraries = []
+    gdb_skipped_ranges.clear()
+    for pattern in get_list_setting("skip_files", []):
+        add_skip("file", pattern)
+    for name in get_list_setting("skip_function_names", []):
+        add_skip("function name", name)
+    for regex in get_list_setting("skip_functions", []):
+        add_skip("function", regex)
+    for pattern in get_list_setting("skip_libraries", []):
+        add_skip("library", pattern)
 
 
 def listify(var):
@@ -1189,6 +3181,8 @@ def update_cursor():
     global gdb_cursor_position
     global gdb_stack_index
     global gdb_stack_frame
+    global gdb_cursor_epoch
+    global gdb_cursor_thread
 
     res = run_cmd("-stack-info-frame", True)
     if get_result(res) == "error":
@@ -1201,83 +3195,268 @@ def update_cursor():
     if "fullname" in currFrame:
         gdb_cursor = currFrame["fullname"]
         gdb_cursor_position = int(currFrame["line"])
-        sublime.active_window().focus_group(get_setting("file_group", 0))
+        sublime.active_window().focus_group(get_int_setting("file_group", 0))
         sublime.active_window().open_file("%s:%d" % (gdb_cursor, gdb_cursor_position), sublime.ENCODED_POSITION)
     else:
         gdb_cursor_position = 0
 
+    if gdb_cursor_epoch != gdb_stop_epoch:
+        drop_thread_states()
+        gdb_cursor_epoch = gdb_stop_epoch
+
     sameFrame = gdb_stack_frame != None and \
-                gdb_stack_frame["func"] == currFrame["func"]
+                gdb_stack_frame["func"] == currFrame["func"] and \
+                gdb_cursor_thread == gdb_threads_view.current_thread
     if sameFrame and "shlibname" in currFrame and "shlibname" in gdb_stack_frame:
         sameFrame = currFrame["shlibname"] == gdb_stack_frame["shlibname"]
     if sameFrame and "fullname" in currFrame and "fullname" in gdb_stack_frame:
         sameFrame = currFrame["fullname"] == gdb_stack_frame["fullname"]
 
     gdb_stack_frame = currFrame
+    gdb_cursor_thread = gdb_threads_view.current_thread
     # Always need to update the callstack since it's possible to
     # end up in the current function from many different call stacks
-    gdb_callstack_view.update_callstack()
-    gdb_threads_view.update_threads()
+    timed("callstack", gdb_callstack_view.update_callstack)
+    timed("threads", gdb_threads_view.update_threads)
+
+    timed("markers", update_view_markers)
+    timed("variables", gdb_variables_view.update_variables, sameFrame)
+    timed("watches", gdb_watch_view.update_watches)
+    timed("registers", gdb_register_view.update_values)
+    timed("disassembly", gdb_disassembly_view.update_disassembly)
+    timed("memory", gdb_memory_view.update_memory)
+    stop_rendered()
+    if gdb_cursor_epoch != gdb_memory_diff_view.epoch:
+        gdb_memory_diff_view.epoch = gdb_cursor_epoch
+        gdb_memory_diff_view.update_snapshots()
+
+
+def stop_rendered():
+    global gdb_stop_time
+    if gdb_stop_time == None:
+        return
+    elapsed = (time.time() - gdb_stop_time) * 1000
+    gdb_stop_time = None
+    gdb_render_times.append(elapsed)
+    gdb_stats.add_stage("stop to render", elapsed)
+    if gdb_session.transcript != None:
+        gdb_session.transcript.render(elapsed)
+    gdb_stats_view.render()
+
+
+def format_render_times(times):
+    if len(times) == 0:
+        return "no stops"
+    return "%d stops, %.1f ms average, %.1f ms max" % (len(times), sum(times) / len(times), max(times))
+
+
+def report_replay(replay):
+    msg = "Replayed %s (recorded: %s)\n" % (format_render_times(gdb_render_times), format_render_times(replay.renders))
+    print msg
+    gdb_session_view.add_line(msg)
+
+
+class GDBThreadState:
+    def __init__(self):
+        self.epoch = gdb_stop_epoch
+        self.cursor = (gdb_cursor, gdb_cursor_position, gdb_stack_index, gdb_stack_frame)
+        self.callstack = gdb_callstack_view.get_state()
+        self.variables = gdb_variables_view.get_state()
+        self.registers = gdb_register_view.get_state()
+        self.disassembly = gdb_disassembly_view.get_state()
+        self.dirty = [v for v in self.get_views() if v.dirty]
+
+    def get_views(self):
+        return [gdb_callstack_view, gdb_variables_view, gdb_register_view, gdb_disassembly_view]
+
+    def restore(self):
+        global gdb_cursor
+        global gdb_cursor_position
+        global gdb_stack_index
+        global gdb_stack_frame
+        gdb_cursor, gdb_cursor_position, gdb_stack_index, gdb_stack_frame = self.cursor
+        # -thread-select puts gdb on frame 0, hovers, watches and
+        # register edits have to be evaluated in the frame shown
+        if gdb_stack_index > 0:
+            run_cmd("-stack-select-frame %d" % gdb_stack_index)
+        if gdb_cursor_position != 0:
+            sublime.active_window().focus_group(get_int_setting("file_group", 0))
+            sublime.active_window().open_file("%s:%d" % (gdb_cursor, gdb_cursor_position), sublime.ENCODED_POSITION)
+        gdb_callstack_view.set_state(self.callstack)
+        gdb_variables_view.set_state(self.variables)
+        gdb_register_view.set_state(self.registers)
+        gdb_disassembly_view.set_state(self.disassembly)
+        # Views that were hidden when the state was saved hold stale
+        # data, so catch up on whichever of them can be seen now
+        for v in self.get_views():
+            v.dirty = v in self.dirty
+            v.on_activated()
+        gdb_watch_view.update_watches()
+        update_view_markers()
+
+    def discard(self):
+        gdb_variables_view.discard_state(self.variables)
+
+
+def drop_thread_states():
+    global gdb_thread_states
+    for state in gdb_thread_states.values():
+        state.discard()
+    gdb_thread_states = {}
+
+
+def switch_thread(thread):
+    global gdb_cursor_thread
+    global gdb_stack_frame
+    if gdb_cursor_thread != -1 and gdb_cursor_epoch == gdb_stop_epoch:
+        gdb_thread_states[gdb_cursor_thread] = GDBThreadState()
+    gdb_threads_view.select_thread(thread)
+
+    state = gdb_thread_states.pop(thread, None)
+    if state != None and state.epoch == gdb_stop_epoch:
+        # Rendered straight from the cache, the only things sent
+        # to gdb are -thread-select and -stack-select-frame which
+        # aren't waited on
+        gdb_cursor_thread = thread
+        state.restore()
+        return
+    if state != None:
+        state.discard()
+    # The views' state now belongs to the cached thread state, so
+    # start from scratch rather than updating it for the new thread
+    gdb_variables_view.set_state(([], {}, 0))
+    gdb_register_view.set_state((None, []))
+    gdb_callstack_view.frames = []
+    gdb_stack_frame = None
+    update_cursor()
+
+
+def select_frame(level):
+    global gdb_cursor
+    global gdb_cursor_position
+    global gdb_stack_index
+
+    # Only the state that depends on the selected frame is refetched,
+    # the callstack and threads are still valid for this stop.
+    frame = gdb_callstack_view.frames[level]
+    gdb_stack_index = level
+    if frame.filename != None:
+        gdb_cursor = frame.filename
+        gdb_cursor_position = frame.line
+        sublime.active_window().focus_group(get_int_setting("file_group", 0))
+        sublime.active_window().open_file("%s:%d" % (gdb_cursor, gdb_cursor_position), sublime.ENCODED_POSITION)
+    else:
+        gdb_cursor_position = 0
 
     update_view_markers()
-    gdb_variables_view.update_variables(sameFrame)
+    gdb_variables_view.select_frame(level)
+    gdb_watch_view.update_watches()
     gdb_register_view.update_values()
     gdb_disassembly_view.update_disassembly()
 
 
+def parse_async_record(line):
+    return gdb_session.parse_async_record(line)
+
+
+def handle_notification(cls, res):
+    if cls == "thread-created":
+        gdb_threads_view.thread_created(int(res["id"]), res["group-id"] if "group-id" in res else None)
+    elif cls == "thread-exited":
+        gdb_threads_view.thread_exited(int(res["id"]))
+    elif cls == "thread-group-exited":
+        gdb_threads_view.thread_group_exited(res["id"])
+    elif cls == "thread-selected":
+        gdb_threads_view.current_thread = int(res["id"])
+    elif cls.startswith("breakpoint-"):
+        bkpt = None
+        if cls == "breakpoint-modified":
+            number = int(listify(res["bkpt"])[0]["number"])
+            bkpt = gdb_breakpoint_view.numbers.get(number)
+        if isinstance(bkpt, GDBLogpoint):
+            gdb_breakpoint_view.logpoint_modified(number, res)
+        else:
+            sublime.set_timeout(lambda: gdb_breakpoint_view.breakpoint_notification(cls, res), 0)
+    elif cls == "memory-changed":
+        sublime.set_timeout(lambda: gdb_memory_view.memory_changed(res), 0)
+    elif cls == "library-loaded":
+        library_loaded(res)
+    elif cls == "library-unloaded":
+        gdb_skipped_ranges.pop(res.get("id", res.get("target-name")), None)
+
+
+def handle_run_status(status, line):
+    global gdb_stop_epoch
+    cls, res = parse_async_record(line[line.find("*"):])
+    if status == "running":
+        gdb_threads_view.threads_running(res["thread-id"] if "thread-id" in res else "all")
+    elif status == "stopped":
+        gdb_stop_epoch += 1
+        id = int(res["thread-id"]) if "thread-id" in res else -1
+        gdb_threads_view.threads_stopped(res["stopped-threads"] if "stopped-threads" in res else "all",
+                                         id, res["frame"] if "frame" in res else None)
+
+
 def session_ended_status_message():
     sublime.status_message("GDB session ended")
 
 
-def gdboutput(pipe):
-    global gdb_process
-    global gdb_lastresult
-    global gdb_lastline
+def gdb_command_sent(text):
+    log_debug(text)
+    gdb_session_view.add_line(text)
+
+
+def gdb_line_read(line):
+    log_debug(line)
+    gdb_session_view.add_line("%s\n" % line)
+
+
+def gdb_status_changed(status, line):
+    global gdb_run_status
+    global gdb_stop_time
+    gdb_run_status = status
+    handle_run_status(gdb_run_status, line)
+    reason = re.search("(?<=reason=\")[a-zA-Z0-9\-]+(?=\")", line)
+    if reason != None and reason.group(0).startswith("exited"):
+        run_cmd("-gdb-exit")
+    elif not "running" in gdb_run_status and not gdb_shutting_down and \
+            not continue_stepping(line):
+        thread_id = re.search('thread-id="(\d+)"', line)
+        if thread_id != None:
+            gdb_threads_view.select_thread(int(thread_id.group(1)))
+        gdb_stop_time = time.time()
+        sublime.set_timeout(update_cursor, 0)
+
+
+def gdb_console_output(text):
+    if text.startswith("[logpoint "):
+        gdb_logpoint_view.log(text)
+    else:
+        gdb_console_view.add_line(text)
+
+
+def gdb_session_ended():
     global gdb_stack_frame
     global gdb_run_status
     global gdb_stack_index
-    command_result_regex = re.compile("^\d+\^")
-    run_status_regex = re.compile("(^\d*\*)([^,]+)")
-    while True:
-        try:
-            if gdb_process.poll() != None:
-                break
-            line = pipe.readline().strip()
-
-            if len(line) > 0:
-                log_debug(line)
-                gdb_session_view.add_line("%s\n" % line)
-
-                run_status = run_status_regex.match(line)
-                if run_status != None:
-                    gdb_run_status = run_status.group(2)
-                    reason = re.search("(?<=reason=\")[a-zA-Z0-9\-]+(?=\")", line)
-                    if reason != None and reason.group(0).startswith("exited"):
-                        run_cmd("-gdb-exit")
-                    elif not "running" in gdb_run_status and not gdb_shutting_down:
-                        thread_id = re.search('thread-id="(\d+)"', line)
-                        if thread_id != None:
-                            gdb_threads_view.select_thread(int(thread_id.group(1)))
-                        sublime.set_timeout(update_cursor, 0)
-                if not line.startswith("(gdb)"):
-                    gdb_lastline = line
-                if command_result_regex.match(line) != None:
-                    gdb_lastresult = line
-
-                if line.startswith("~"):
-                    gdb_console_view.add_line(
-                        line[2:-1].replace("\\n", "\n").replace("\\\"", "\"").replace("\\t", "\t"))
-
-        except:
-            traceback.print_exc()
-    if pipe == gdb_process.stdout:
-        gdb_session_view.add_line("GDB session ended\n")
-        sublime.set_timeout(session_ended_status_message, 0)
-        gdb_stack_frame = None
     global gdb_cursor_position
+    global gdb_cursor_thread
+    global gdb_thread_states
+    global gdb_trace_frame
+    global gdb_stepping
+    gdb_session_view.add_line("GDB session ended\n")
+    sublime.set_timeout(session_ended_status_message, 0)
+    gdb_stack_frame = None
     gdb_stack_index = -1
     gdb_cursor_position = 0
     gdb_run_status = None
+    gdb_cursor_thread = -1
+    gdb_thread_states = {}
+    gdb_trace_frame = -1
+    gdb_stepping = False
+    del gdb_step_queue[:]
+    if gdb_session.is_replay():
+        report_replay(gdb_session.process)
     sublime.set_timeout(update_view_markers, 0)
 
     for view in gdb_views:
@@ -1285,33 +3464,100 @@ def gdboutput(pipe):
     sublime.set_timeout(cleanup, 0)
 
 
+gdb_session.on("command", gdb_stats.command_sent)
+gdb_session.on("write", gdb_command_sent)
+gdb_session.on("line", gdb_line_read)
+gdb_session.on("notify", handle_notification)
+gdb_session.on("status", gdb_status_changed)
+gdb_session.on("result", gdb_stats.result_read)
+gdb_session.on("console", gdb_console_output)
+gdb_session.on("target", gdb_console_view.add_line)
+gdb_session.on("exit", gdb_stats.session_ended)
+gdb_session.on("exit", gdb_session_ended)
+
+
 def cleanup():
-    if get_setting("close_views", True):
+    if get_bool_setting("close_views", True):
         for view in gdb_views:
             view.close()
-    if get_setting("push_pop_layout", True):
+    if get_bool_setting("push_pop_layout", True):
         gdb_bkp_window.set_layout(gdb_bkp_layout)
         gdb_bkp_window.focus_view(gdb_bkp_view)
 
 
-def programoutput(pipe):
-    global gdb_process
-    exception_count = 0
-    while exception_count < 100:
-        try:
-            proc = gdb_process.poll() != None
-            line = pipe.readline()
-            if len(line) > 0:
-                gdb_console_view.add_line(line)
-            else:
-                if proc:
-                    break
-                time.sleep(0.1)
-        except:
-            traceback.print_exc()
-            exception_count = exception_count + 1
-    if not pipe == None:
-        pipe.close()
+gdb_hover_epoch = -1
+gdb_hover_cache = {}
+gdb_hover_request = 0
+identifier_regex = re.compile("^[A-Za-z_][A-Za-z0-9_]*$")
+# Members and indexes of a variable, nothing that could assign or call
+# anything, since hovers are evaluated without asking
+hover_path_regex = re.compile("^[A-Za-z_]\\w*(\\s*(\\.|->)\\s*[A-Za-z_]\\w*|\\[\\w+\\])*$")
+
+
+def get_hover_expression(view):
+    sel = view.sel()
+    if len(sel) != 1:
+        return None
+    if sel[0].empty():
+        exp = view.substr(view.word(sel[0].begin())).strip()
+        if identifier_regex.match(exp) == None:
+            return None
+    else:
+        exp = view.substr(sel[0]).strip()
+        if hover_path_regex.match(exp) == None:
+            return None
+    return exp
+
+
+def hover_requested(view):
+    # Only evaluated once the cursor has stayed put for a while
+    global gdb_hover_request
+    gdb_hover_request += 1
+    request = gdb_hover_request
+    sublime.set_timeout(lambda: hover_evaluate(view, request), get_int_setting("hover_delay", 300, view))
+
+
+def hover_evaluate(view, request):
+    global gdb_hover_epoch
+    global gdb_hover_cache
+    if request != gdb_hover_request:
+        return
+    exp = None
+    if is_running() and gdb_run_status == "stopped":
+        exp = get_hover_expression(view)
+    if exp == None:
+        view.erase_status("sublimegdb_hover")
+        return
+    if gdb_hover_epoch != gdb_stop_epoch:
+        gdb_hover_epoch = gdb_stop_epoch
+        gdb_hover_cache = {}
+    key = (exp, gdb_cursor_thread, gdb_stack_index)
+    if key in gdb_hover_cache:
+        show_hover(view, exp, gdb_hover_cache[key])
+        return
+    epoch = gdb_hover_epoch
+    run_cmd("-data-evaluate-expression %s" % mi_quote(exp),
+            callback=lambda line: hover_result(view, key, epoch, request, line))
+
+
+def hover_result(view, key, epoch, request, line):
+    value = None
+    if get_result(line) != "error":
+        value = parse_result_line(line)["value"]
+    if epoch == gdb_hover_epoch:
+        gdb_hover_cache[key] = value
+    if request == gdb_hover_request:
+        show_hover(view, key[0], value)
+
+
+def show_hover(view, exp, value):
+    if value == None:
+        view.erase_status("sublimegdb_hover")
+        return
+    value = " ".join(value.split())
+    if len(value) > 200:
+        value = value[:200] + "..."
+    view.set_status("sublimegdb_hover", "%s = %s" % (exp, value))
 
 
 def show_input():
@@ -1333,7 +3579,7 @@ def input_on_change(s):
 
 
 def is_running():
-    return gdb_process != None and gdb_process.poll() == None
+    return gdb_session.is_running()
 
 
 class GdbInput(sublime_plugin.WindowCommand):
@@ -1343,20 +3589,19 @@ class GdbInput(sublime_plugin.WindowCommand):
 
 class GdbLaunch(sublime_plugin.WindowCommand):
     def run(self):
-        global gdb_process
         global gdb_run_status
         global gdb_bkp_window
         global gdb_bkp_view
         global gdb_bkp_layout
         global gdb_shutting_down
-        if gdb_process == None or gdb_process.poll() != None:
+        if not is_running():
             executable = get_setting("executable")
-            commandline = "gdb --interpreter=mi --args %s" % executable
+            gdb = expand_path(get_setting("gdb_command", "gdb"), self.window)
+            commandline = "%s --interpreter=mi --args %s" % (gdb, executable)
             path = expand_path(get_setting("workingdir", "/tmp", self.window.active_view()), self.window)
-            print "Running: %s" % commandline
-            print "In directory: %s" % path
-            gdb_process = subprocess.Popen(commandline, shell=True, cwd=path,
-                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            replay = get_setting("replay_transcript", "")
+            record = get_setting("record_transcript", "")
+            del gdb_render_times[:]
 
             gdb_bkp_window = sublime.active_window()
             #back up current layout before opening the debug one
@@ -1380,26 +3625,29 @@ class GdbLaunch(sublime_plugin.WindowCommand):
 
             gdb_shutting_down = False
 
-            t = threading.Thread(target=gdboutput, args=(gdb_process.stdout,))
-            t.start()
-            pipe, name = tempfile.mkstemp()
-            t = threading.Thread(target=programoutput, args=(os.fdopen(pipe),))
-            t.start()
+            if len(replay) > 0:
+                print "Replaying: %s" % replay
+                gdb_session.replay(os.path.expanduser(replay), get_setting("replay_speed", 0))
+            else:
+                print "Running: %s" % commandline
+                print "In directory: %s" % path
+                gdb_session.start(commandline, path, os.path.expanduser(record) if len(record) > 0 else None)
             try:
                 run_cmd("-gdb-show interpreter", True, timeout=20)
             except:
                 sublime.error_message("""\
 It seems you're not running gdb with the "mi" interpreter. Please add
 "--interpreter=mi" to your gdb command line""")
-                gdb_process.stdin.write("quit\n")
+                gdb_session.write("quit\n")
                 return
-            run_cmd("-inferior-tty-set %s" % name)
+            gdb_session.redirect_target_output()
 
             run_cmd("-gdb-set target-async 1")
             run_cmd("-gdb-set pagination off")
             # if gdb_nonstop:
             #     run_cmd("-gdb-set non-stop on")
 
+            apply_skips()
             gdb_breakpoint_view.sync_breakpoints()
             gdb_run_status = "running"
             run_cmd(get_setting("exec_cmd"), True)
@@ -1456,10 +3704,10 @@ class GdbPause(sublime_plugin.WindowCommand):
 
 class GdbStepOver(sublime_plugin.WindowCommand):
     def run(self):
-        run_cmd("-exec-next")
+        step("-exec-next")
 
     def is_enabled(self):
-        return is_running() and gdb_run_status != "running"
+        return is_running() and (gdb_run_status != "running" or gdb_stepping)
 
     def is_visible(self):
         return is_running()
@@ -1467,10 +3715,10 @@ class GdbStepOver(sublime_plugin.WindowCommand):
 
 class GdbStepInto(sublime_plugin.WindowCommand):
     def run(self):
-        run_cmd("-exec-step")
+        step("-exec-step")
 
     def is_enabled(self):
-        return is_running() and gdb_run_status != "running"
+        return is_running() and (gdb_run_status != "running" or gdb_stepping)
 
     def is_visible(self):
         return is_running()
@@ -1478,7 +3726,251 @@ class GdbStepInto(sublime_plugin.WindowCommand):
 
 class GdbNextInstruction(sublime_plugin.WindowCommand):
     def run(self):
-        run_cmd("-exec-next-instruction")
+        step("-exec-next-instruction")
+
+    def is_enabled(self):
+        return is_running() and (gdb_run_status != "running" or gdb_stepping)
+
+    def is_visible(self):
+        return is_running()
+
+
+class GdbSkip(sublime_plugin.WindowCommand):
+    def run(self):
+        self.items = []
+        if gdb_stack_frame != None and "func" in gdb_stack_frame:
+            self.items.append(("function name", gdb_stack_frame["func"],
+                               "Skip function %s" % gdb_stack_frame["func"]))
+        if gdb_cursor_position != 0:
+            self.items.append(("file", gdb_cursor, "Skip file %s" % gdb_cursor))
+        self.items.append(("function", None, "Skip functions matching..."))
+        self.items.append(("file", None, "Skip files matching..."))
+        self.items.append(("library", None, "Skip shared libraries matching..."))
+        self.window.show_quick_panel([item[2] for item in self.items], self.on_select)
+
+    def on_select(self, idx):
+        if idx == -1:
+            return
+        kind, value, caption = self.items[idx]
+        if value != None:
+            self.add(kind, value)
+        else:
+            prompt = "Function regex" if kind == "function" else "Glob"
+            self.window.show_input_panel(prompt, "", lambda v: self.add(kind, v.strip()), None, None)
+
+    def add(self, kind, value):
+        if len(value) == 0:
+            return
+        key = {"function name": "skip_function_names", "function": "skip_functions",
+               "file": "skip_files", "library": "skip_libraries"}[kind]
+        settings = get_plugin_settings()
+        values = settings.get(key, [])
+        if value not in values:
+            settings.set(key, values + [value])
+            sublime.save_settings("SublimeGDB.sublime-settings")
+        if is_running():
+            add_skip(kind, value)
+        sublime.status_message("Added to %s" % key)
+
+
+class GdbShowMemory(sublime_plugin.WindowCommand):
+    def run(self):
+        self.window.show_input_panel("Address", "", self.on_done, None, None)
+
+    def on_done(self, exp):
+        res = run_cmd("-data-evaluate-expression %s" % mi_quote(exp), True)
+        if get_result(res) == "error":
+            sublime.status_message("Error: %s" % res[res.find("msg=") + 4:])
+            return
+        try:
+            addr = parse_address(parse_result_line(res)["value"])
+        except ValueError:
+            sublime.status_message("%s is not an address" % exp)
+            return
+        gdb_memory_view.open()
+        gdb_memory_view.set_address(addr)
+
+    def is_enabled(self):
+        return is_running() and gdb_run_status != "running"
+
+
+class GdbPinMemory(sublime_plugin.WindowCommand):
+    def run(self):
+        self.window.show_input_panel("Address, length", "", self.on_done, None, None)
+
+    def on_done(self, text):
+        exp, sep, length = text.rpartition(",")
+        if len(sep) == 0:
+            exp = length
+            length = "sizeof(*(%s))" % exp
+        exp = exp.strip()
+        res = run_cmd("-data-evaluate-expression %s" % mi_quote(exp), True)
+        lres = run_cmd("-data-evaluate-expression %s" % mi_quote(length.strip()), True)
+        try:
+            if get_result(res) == "error" or get_result(lres) == "error":
+                raise ValueError
+            addr = parse_address(parse_result_line(res)["value"])
+            size = int(parse_result_line(lres)["value"], 0)
+        except ValueError:
+            sublime.status_message("Couldn't pin %s" % text)
+            return
+        gdb_memory_diff_view.open()
+        gdb_memory_diff_view.pin(exp, addr, size)
+
+    def is_enabled(self):
+        return is_running() and gdb_run_status != "running"
+
+
+class GdbUnpinMemory(sublime_plugin.WindowCommand):
+    def run(self):
+        items = [r.format_header().strip() for r in gdb_memory_diff_view.regions]
+        self.window.show_quick_panel(items, self.on_done)
+
+    def on_done(self, idx):
+        if idx != -1:
+            gdb_memory_diff_view.unpin(idx)
+
+    def is_enabled(self):
+        return len(gdb_memory_diff_view.regions) > 0
+
+
+class GdbAddWatchExpression(sublime_plugin.TextCommand):
+    def run(self, edit):
+        sel = self.view.sel()
+        if len(sel) == 1 and not sel[0].empty():
+            # Confirmed in the input panel, so anything selected will do
+            exp = self.view.substr(sel[0]).strip()
+        else:
+            exp = get_hover_expression(self.view) or ""
+        self.view.window().show_input_panel("Watch", exp, self.on_done, None, None)
+
+    def on_done(self, exp):
+        exp = exp.strip()
+        if len(exp) > 0:
+            gdb_watch_view.open()
+            gdb_watch_view.add_expression(exp)
+
+
+class WatchExpressionPicker(object):
+    def run(self):
+        items = [exp if not frozen else "%s (frozen)" % exp for exp, frozen in gdb_watch_view.expressions]
+        self.window.show_quick_panel(items, self.on_done)
+
+    def on_done(self, idx):
+        if idx != -1:
+            self.apply(idx)
+
+    def is_enabled(self):
+        return len(gdb_watch_view.expressions) > 0
+
+
+class GdbRemoveWatchExpression(WatchExpressionPicker, sublime_plugin.WindowCommand):
+    def apply(self, idx):
+        gdb_watch_view.remove_expression(idx)
+
+
+class GdbFreezeWatchExpression(WatchExpressionPicker, sublime_plugin.WindowCommand):
+    def apply(self, idx):
+        gdb_watch_view.toggle_frozen(idx)
+
+
+class GdbRefreshWatchExpressions(sublime_plugin.WindowCommand):
+    def run(self):
+        gdb_watch_view.update_watches(frozen=True)
+
+    def is_enabled(self):
+        return is_running() and gdb_run_status == "stopped" and gdb_watch_view.is_open()
+
+
+class GdbMemoryScroll(sublime_plugin.WindowCommand):
+    def run(self, pages=1):
+        gdb_memory_view.scroll_pages(pages)
+
+    def is_enabled(self):
+        return is_running() and gdb_memory_view.is_open() and gdb_memory_view.address != None
+
+
+class GdbShowStepTrail(sublime_plugin.WindowCommand):
+    def run(self):
+        self.trail = list(gdb_step_trail)
+        items = []
+        for func, fullname, line in self.trail:
+            if fullname != None:
+                items.append([func, "%s:%d" % (fullname, line)])
+            else:
+                items.append([func, "??"])
+        self.window.show_quick_panel(items, self.on_done)
+
+    def on_done(self, idx):
+        if idx == -1 or self.trail[idx][1] == None:
+            return
+        func, fullname, line = self.trail[idx]
+        self.window.focus_group(get_int_setting("file_group", 0))
+        self.window.open_file("%s:%d" % (fullname, line), sublime.ENCODED_POSITION)
+
+    def is_enabled(self):
+        return len(gdb_step_trail) > 0
+
+
+def trace_find(mode):
+    global gdb_trace_frame
+    global gdb_stop_epoch
+    if mode == "next" or mode == "prev":
+        if gdb_trace_frame == -1 and mode == "next":
+            mode = "frame-number 0"
+        else:
+            mode = "frame-number %d" % (gdb_trace_frame + (1 if mode == "next" else -1))
+    res = run_cmd("-trace-find %s" % mode, True)
+    if get_result(res) == "error":
+        sublime.status_message("Error: %s" % res[res.find("msg=") + 4:])
+        return
+    res = parse_result_line(res)
+    if "found" in res and res["found"] == "1":
+        gdb_trace_frame = int(res["traceframe"])
+        sublime.status_message("Trace frame %d (tracepoint %s)" % (gdb_trace_frame, res["tracepoint"]))
+    else:
+        gdb_trace_frame = -1
+        sublime.status_message("Not browsing trace frames")
+    # The collected data is a different program state, so nothing
+    # cached for the current stop can be used
+    gdb_stop_epoch += 1
+    update_cursor()
+
+
+class GdbTraceStart(sublime_plugin.WindowCommand):
+    def run(self):
+        res = run_cmd("-trace-start", True)
+        if get_result(res) == "error":
+            sublime.status_message("Tracing needs a gdbserver target: %s" % res[res.find("msg=") + 4:])
+        else:
+            sublime.status_message("Tracing started")
+
+    def is_enabled(self):
+        return is_running()
+
+    def is_visible(self):
+        return is_running()
+
+
+class GdbTraceStop(sublime_plugin.WindowCommand):
+    def run(self):
+        res = run_cmd("-trace-stop", True)
+        if get_result(res) == "error":
+            sublime.status_message("Error: %s" % res[res.find("msg=") + 4:])
+            return
+        res = parse_result_line(res)
+        sublime.status_message("Tracing stopped, %s trace frames collected" % (res["frames"] if "frames" in res else "no"))
+
+    def is_enabled(self):
+        return is_running()
+
+    def is_visible(self):
+        return is_running()
+
+
+class GdbTraceFind(sublime_plugin.WindowCommand):
+    def run(self, mode="next"):
+        trace_find(mode)
 
     def is_enabled(self):
         return is_running() and gdb_run_status != "running"
@@ -1498,6 +3990,18 @@ class GdbStepOut(sublime_plugin.WindowCommand):
         return is_running()
 
 
+class GdbCollectUniqueStacks(sublime_plugin.WindowCommand):
+    def run(self):
+        gdb_unique_stacks_view.open()
+        gdb_unique_stacks_view.collect()
+
+    def is_enabled(self):
+        return is_running() and gdb_run_status != "running" and not gdb_unique_stacks_view.collecting
+
+    def is_visible(self):
+        return is_running()
+
+
 class GdbAddWatch(sublime_plugin.TextCommand):
     def run(self, edit):
         if gdb_variables_view.is_open() and self.view.id() == gdb_variables_view.get_view().id():
@@ -1512,23 +4016,102 @@ class GdbAddWatch(sublime_plugin.TextCommand):
 
 
 class GdbToggleBreakpoint(sublime_plugin.TextCommand):
-    def run(self, edit):
+    def run(self, edit, logpoint=False, tracepoint=False):
         fn = self.view.file_name()
 
+        if tracepoint and fn != None:
+            gdb_breakpoint_view.begin()
+            for sel in self.view.sel():
+                gdb_breakpoint_view.toggle_tracepoint(fn, self.view.rowcol(sel.a)[0] + 1)
+            gdb_breakpoint_view.commit()
+            update_view_markers(self.view)
+            return
+
+        if logpoint and fn != None:
+            line = self.view.rowcol(self.view.sel()[0].begin())[0] + 1
+            bkpt = gdb_breakpoint_view.find_breakpoint(fn, line)
+            message = bkpt.message if isinstance(bkpt, GDBLogpoint) else ""
+            self.view.window().show_input_panel("Log message", message,
+                lambda m: self.add_logpoint(fn, line, m), None, None)
+            return
+
         if gdb_breakpoint_view.is_open() and self.view.id() == gdb_breakpoint_view.get_view().id():
             row = self.view.rowcol(self.view.sel()[0].begin())[0]
             if row < len(gdb_breakpoint_view.breakpoints):
-                gdb_breakpoint_view.breakpoints[row].remove()
-                gdb_breakpoint_view.breakpoints.pop(row)
+                gdb_breakpoint_view.remove_breakpoint(gdb_breakpoint_view.breakpoints[row])
                 gdb_breakpoint_view.update_view()
         elif gdb_variables_view.is_open() and self.view.id() == gdb_variables_view.get_view().id():
             var = gdb_variables_view.get_variable_at_line(self.view.rowcol(self.view.sel()[0].begin())[0])
             if var != None:
                 gdb_breakpoint_view.toggle_watch(var.get_expression())
         else:
+            gdb_breakpoint_view.begin()
             for sel in self.view.sel():
                 line, col = self.view.rowcol(sel.a)
                 gdb_breakpoint_view.toggle_breakpoint(fn, line + 1)
+            gdb_breakpoint_view.commit()
+        update_view_markers(self.view)
+
+    def add_logpoint(self, fn, line, message):
+        gdb_breakpoint_view.add_logpoint(fn, line, message)
+        update_view_markers(self.view)
+
+
+class GdbEditBreakpoint(sublime_plugin.TextCommand):
+    def run(self, edit, what="condition"):
+        if gdb_breakpoint_view.is_open() and self.view.id() == gdb_breakpoint_view.get_view().id():
+            row = self.view.rowcol(self.view.sel()[0].begin())[0]
+            if row >= len(gdb_breakpoint_view.breakpoints):
+                return
+            self.fn, self.line = None, 0
+            self.bkpt = gdb_breakpoint_view.breakpoints[row]
+        else:
+            self.fn = self.view.file_name()
+            if self.fn == None:
+                return
+            self.line = self.view.rowcol(self.view.sel()[0].begin())[0] + 1
+            self.bkpt = gdb_breakpoint_view.find_breakpoint(self.fn, self.line)
+
+        if what == "temporary":
+            self.on_done(lambda bkpt: self.set_temporary(bkpt))
+        elif what == "ignore":
+            count = str(self.bkpt.ignore_count) if self.bkpt != None else "0"
+            self.view.window().show_input_panel("Ignore count", count, self.ignore_count_done, None, None)
+        else:
+            condition = self.bkpt.condition if self.bkpt != None else ""
+            self.view.window().show_input_panel("Break if", condition,
+                lambda c: self.on_done(lambda bkpt: bkpt.set_condition(c.strip())), None, None)
+
+    def ignore_count_done(self, count):
+        try:
+            count = int(count.strip())
+        except ValueError:
+            count = -1
+        if count < 0:
+            sublime.status_message("The ignore count has to be a number of hits")
+            return
+        self.on_done(lambda bkpt: bkpt.set_ignore_count(count))
+
+    def set_temporary(self, bkpt):
+        bkpt.temporary = not bkpt.temporary
+        if bkpt.number != -1:
+            # Temporary is only an option when inserting
+            gdb_breakpoint_view.begin()
+            bkpt.remove()
+            bkpt.add()
+            gdb_breakpoint_view.commit()
+
+    def on_done(self, apply):
+        if self.bkpt == None:
+            # No breakpoint on the line yet, so set it up before inserting it
+            bkpt = GDBBreakpoint(self.fn, self.line, insert=False)
+            apply(bkpt)
+            gdb_breakpoint_view.add_breakpoint(bkpt)
+            bkpt.add()
+        else:
+            apply(self.bkpt)
+            gdb_breakpoint_view.schedule_save()
+        gdb_breakpoint_view.update_view()
         update_view_markers(self.view)
 
 
@@ -1544,7 +4127,8 @@ class GdbClick(sublime_plugin.TextCommand):
             gdb_callstack_view.select(row)
         elif gdb_threads_view.is_open() and self.view.id() == gdb_threads_view.get_view().id():
             gdb_threads_view.select(row)
-            update_cursor()
+        elif gdb_unique_stacks_view.is_open() and self.view.id() == gdb_unique_stacks_view.get_view().id():
+            gdb_unique_stacks_view.select(row)
 
     def is_enabled(self):
         return is_running()
@@ -1554,10 +4138,14 @@ class GdbDoubleClick(sublime_plugin.TextCommand):
     def run(self, edit):
         if gdb_variables_view.is_open() and self.view.id() == gdb_variables_view.get_view().id():
             self.view.run_command("gdb_edit_variable")
+        elif gdb_breakpoint_view.is_open() and self.view.id() == gdb_breakpoint_view.get_view().id():
+            self.view.run_command("gdb_edit_breakpoint")
         else:
             self.view.run_command("gdb_edit_register")
 
     def is_enabled(self):
+        if gdb_breakpoint_view.is_open() and self.view.id() == gdb_breakpoint_view.get_view().id():
+            return True
         return is_running() and \
                 ((gdb_variables_view.is_open() and self.view.id() == gdb_variables_view.get_view().id()) or \
                  (gdb_register_view.is_open() and self.view.id() == gdb_register_view.get_view().id()))
@@ -1629,6 +4217,8 @@ class GdbEventListener(sublime_plugin.EventListener):
             v = gdb_variables_view
             if key.startswith("gdb_register_view"):
                 v = gdb_register_view
+            elif key.startswith("gdb_memory_view"):
+                v = gdb_memory_view
             elif key.startswith("gdb_disassembly_view"):
                 v = gdb_disassembly_view
             if key.endswith("open"):
@@ -1640,14 +4230,33 @@ class GdbEventListener(sublime_plugin.EventListener):
         return None
 
     def on_activated(self, view):
+        gdb_breakpoint_view.window_activated(view.window())
         if view.file_name() != None:
             update_view_markers(view)
+        for v in gdb_views:
+            if v.is_open() and view.id() == v.get_view().id():
+                v.on_activated()
+                break
 
     def on_load(self, view):
         if view.file_name() != None:
             update_view_markers(view)
 
+    def on_modified(self, view):
+        gdb_breakpoint_view.update_lines(view)
+
+    def on_selection_modified(self, view):
+        # Sublime Text 2 has no hover event, so the word at the cursor
+        # is evaluated instead
+        if view.file_name() == None or not get_bool_setting("hover_evaluate", True, view):
+            return
+        if is_running() or len(view.get_status("sublimegdb_hover")) > 0:
+            hover_requested(view)
+
     def on_close(self, view):
+        if view.id() in gdb_settings_watched:
+            gdb_settings_watched.discard(view.id())
+            settings_changed()
         for v in gdb_views:
             if v.is_open() and view.id() == v.get_view().id():
                 v.was_closed()
@@ -1731,6 +4340,62 @@ class GdbOpenBreakpointView(sublime_plugin.WindowCommand):
         return not gdb_breakpoint_view.is_open()
 
 
+class GdbOpenWatchView(sublime_plugin.WindowCommand):
+    def run(self):
+        gdb_watch_view.open()
+
+    def is_enabled(self):
+        return not gdb_watch_view.is_open()
+
+    def is_visible(self):
+        return not gdb_watch_view.is_open()
+
+
+class GdbOpenStatsView(sublime_plugin.WindowCommand):
+    def run(self):
+        gdb_stats_view.open()
+
+    def is_enabled(self):
+        return not gdb_stats_view.is_open()
+
+    def is_visible(self):
+        return not gdb_stats_view.is_open()
+
+
+class GdbResetStats(sublime_plugin.WindowCommand):
+    def run(self):
+        gdb_stats.reset()
+        gdb_stats_view.render()
+
+
+class GdbExportStats(sublime_plugin.WindowCommand):
+    def run(self):
+        self.window.show_input_panel("Export stats to", get_setting("stats_file", "/tmp/sublimegdb-stats.json"),
+                                     self.on_done, None, None)
+
+    def on_done(self, path):
+        try:
+            f = open(os.path.expanduser(path), "w")
+            try:
+                json.dump(gdb_stats.get_data(), f, indent=4)
+            finally:
+                f.close()
+            sublime.status_message("Stats written to %s" % path)
+        except IOError, e:
+            sublime.status_message("Couldn't write %s: %s" % (path, e))
+
+
+class GdbOpenLogpointView(sublime_plugin.WindowCommand):
+    def run(self):
+        gdb_logpoint_view.open()
+
+    def is_enabled(self):
+        return not gdb_logpoint_view.is_open()
+
+    def is_visible(self):
+        return not gdb_logpoint_view.is_open()
+
+
 class GdbOpenThreadsView(sublime_plugin.WindowCommand):
     def run(self):
         gdb_threads_view.open()
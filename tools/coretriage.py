@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Batch core dump triage with the gdbengine package, no Sublime Text
+needed. Every core is loaded into gdb, the backtraces of all its
+threads are read, and the cores are grouped by where the crashing
+thread was:
+
+    python tools/coretriage.py ./server core.1234 core.1240 core.1302
+    python tools/coretriage.py --depth 3 --json triage.json ./server cores/*
+
+--depth is how many of the innermost frames have to be the same for
+two crashes to count as the same one.
+"""
+import json
+import optparse
+import os
+import pipes
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gdbengine import GDBSession, parse_result_line, get_result
+
+signal_regex = re.compile("Program terminated with signal (\w+)")
+
+
+def listify(var):
+    if not type(var) is list:
+        return [var]
+    return var
+
+
+def format_frame(frame):
+    where = frame.get("func", "??")
+    if "file" in frame:
+        where += " at %s:%s" % (frame["file"], frame.get("line", "?"))
+    elif "from" in frame:
+        where += " from %s" % frame["from"]
+    return where
+
+
+class CoreReport:
+    def __init__(self, core):
+        self.core = core
+        self.signal = None
+        self.error = None
+        self.crashed = None
+        # thread id -> list of frames, innermost first
+        self.stacks = {}
+
+    def signature(self, depth):
+        if self.crashed not in self.stacks:
+            return ("(no stack)",)
+        return tuple([f.get("func", "??") for f in self.stacks[self.crashed][:depth]])
+
+    def get_data(self):
+        return {"core": self.core, "signal": self.signal, "error": self.error, "crashed_thread": self.crashed,
+                "threads": dict([(str(k), [format_frame(f) for f in v]) for k, v in self.stacks.items()])}
+
+
+def triage(gdb, executable, core, timeout):
+    report = CoreReport(core)
+    console = []
+    session = GDBSession()
+    session.on("console", console.append)
+    session.start("%s --interpreter=mi --nx %s %s" % (gdb, pipes.quote(executable), pipes.quote(core)))
+    try:
+        session.run_cmd("-gdb-set pagination off", True, timeout=timeout)
+        line = session.run_cmd("-thread-info", True, timeout=timeout)
+        if get_result(line) == "error":
+            report.error = line[line.find("msg=") + 4:]
+            return report
+        res = parse_result_line(line)
+        threads = [int(t["id"]) for t in listify(res.get("threads", []))]
+        if "current-thread-id" in res:
+            report.crashed = int(res["current-thread-id"])
+        results = session.run_cmds(["-stack-list-frames --thread %d" % id for id in threads], timeout)
+        for id, line in zip(threads, results):
+            if get_result(line) == "done":
+                report.stacks[id] = listify(parse_result_line(line)["stack"]["frame"])
+        for text in console:
+            m = signal_regex.search(text)
+            if m != None:
+                report.signal = m.group(1)
+    except ValueError, e:
+        report.error = str(e)
+    finally:
+        session.exit(timeout)
+    return report
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] executable core...")
+    parser.add_option("--gdb", default="gdb", help="the debugger to run")
+    parser.add_option("--depth", type="int", default=5, help="frames that have to match for the same crash")
+    parser.add_option("--timeout", type="int", default=60, help="seconds to wait for gdb per command")
+    parser.add_option("--json", help="also write the reports to this file")
+    options, args = parser.parse_args()
+    if len(args) < 2:
+        parser.error("need an executable and at least one core")
+    executable, cores = args[0], args[1:]
+
+    reports = []
+    for core in cores:
+        sys.stderr.write("%s\n" % core)
+        reports.append(triage(options.gdb, executable, core, options.timeout))
+
+    crashes = {}
+    for report in reports:
+        if report.error == None:
+            crashes.setdefault(report.signature(options.depth), []).append(report)
+
+    for signature, group in sorted(crashes.items(), key=lambda i: -len(i[1])):
+        first = group[0]
+        signals = sorted(set([r.signal or "?" for r in group]))
+        print "%d core(s), %s, thread %s:" % (len(group), "/".join(signals), first.crashed)
+        for frame in first.stacks.get(first.crashed, [])[:options.depth]:
+            print "    %s" % format_frame(frame)
+        for report in group:
+            print "  %s" % report.core
+        print
+    for report in reports:
+        if report.error != None:
+            print "%s: %s" % (report.core, report.error)
+
+    if options.json:
+        f = open(options.json, "w")
+        try:
+            json.dump([r.get_data() for r in reports], f, indent=4)
+        finally:
+            f.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
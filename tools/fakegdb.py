@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+"""
+A stand-in for "gdb --interpreter=mi" that needs no program to debug.
+
+It answers the MI commands SublimeGDB sends with made up but plausible
+data, so that the plugin can be tried out and timed with any number of
+threads, frames and variables. Point the gdb_command setting at it:
+
+    "gdb_command": "python ${packages}/SublimeGDB/tools/fakegdb.py --threads 200 --delay 5"
+
+Every stop moves the current line forward and changes the values of
+the locals, registers and memory.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+arguments_regex = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+
+def quote(s):
+    return '"%s"' % str(s).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def mi_tuple(**fields):
+    return "{%s}" % ",".join(["%s=%s" % (k.replace("_", "-"), v) for k, v in fields.items()])
+
+
+class FakeGdb:
+    def __init__(self, options):
+        self.options = options
+        self.source = options.source
+        self.stops = 0
+        self.current_thread = 1
+        self.level = 0
+        self.breakpoints = 0
+        self.varobjs = {}
+        self.varobj_count = 0
+
+    def output(self, line):
+        sys.stdout.write("%s\n" % line)
+
+    def prompt(self):
+        self.output("(gdb)")
+        sys.stdout.flush()
+
+    def line(self, thread, level):
+        return 10 + (self.stops + thread + level * 7) % 90
+
+    def frame(self, thread, level, with_level=True):
+        addr = 0x400000 + thread * 0x1000 + level * 0x40
+        if level == 0:
+            # Only the innermost frame moves between stops, the callers
+            # are still at the same return addresses
+            addr += self.stops
+        fields = {
+            "addr": quote("0x%016x" % addr),
+            # A few different call chains so that threads share stacks
+            "func": quote("func_%d_%d" % (thread % 4, level)),
+            "args": "[]",
+            "file": quote(self.source.split("/")[-1]),
+            "fullname": quote(self.source),
+            "line": quote(self.line(thread, level)),
+        }
+        if with_level:
+            fields["level"] = quote(level)
+        return mi_tuple(**fields)
+
+    def stopped(self, reason, extra=""):
+        self.stops += 1
+        self.level = 0
+        self.output('*stopped,reason="%s"%s,frame=%s,thread-id="%d",stopped-threads="all"' %
+                    (reason, extra, self.frame(self.current_thread, 0, False), self.current_thread))
+
+    def resume(self, token, reason, extra=""):
+        self.output("%s^running" % token)
+        self.output('*running,thread-id="all"')
+        self.prompt()
+        time.sleep(self.options.run_delay / 1000.0)
+        self.stopped(reason, extra)
+
+    def value(self, name):
+        # Changes on every stop, but not for every variable
+        return quote((self.stops * (len(name) + 1)) // 3)
+
+    def create_varobj(self, exp, children):
+        self.varobj_count += 1
+        name = "var%d" % self.varobj_count
+        self.varobjs[name] = (exp, children)
+        return name
+
+    def varobj_fields(self, name):
+        exp, children = self.varobjs[name]
+        if children > 0:
+            return 'numchild="%d",value="{...}",type="std::vector<int>"' % children
+        return 'numchild="0",value=%s,type="int"' % self.value(exp)
+
+    def handle(self, token, cmd, args):
+        o = self.options
+        if cmd == "-gdb-exit":
+            self.output("%s^exit" % token)
+            sys.stdout.flush()
+            sys.exit(0)
+        elif cmd == "-gdb-show":
+            return 'value="mi"'
+        elif cmd in ("-break-insert", "-dprintf-insert"):
+            self.breakpoints += 1
+            locations = [a for a in args if re.match(r"^.+:\d+$", a)]
+            line = locations[0].split(":")[-1] if len(locations) > 0 else "0"
+            return "bkpt=%s" % mi_tuple(number=quote(self.breakpoints), type='"breakpoint"', disp='"keep"',
+                                     enabled='"y"', addr='"0x0000000000400000"', func='"func_0_0"',
+                                     file=quote(self.source.split("/")[-1]), fullname=quote(self.source),
+                                     line=quote(line), times='"0"')
+        elif cmd == "-break-watch":
+            self.breakpoints += 1
+            return "wpt=%s" % mi_tuple(number=quote(self.breakpoints), exp=quote(args[-1]))
+        elif cmd in ("-exec-run", "-exec-continue"):
+            if cmd == "-exec-run":
+                self.output('=thread-group-started,id="i1",pid="4242"')
+                for thread in range(1, o.threads + 1):
+                    self.output('=thread-created,id="%d",group-id="i1"' % thread)
+            if self.breakpoints > 0:
+                self.resume(token, "breakpoint-hit", ',disp="keep",bkptno="1"')
+            else:
+                self.resume(token, "signal-received", ',signal-name="SIGINT"')
+            return None
+        elif cmd in ("-exec-next", "-exec-step", "-exec-next-instruction"):
+            self.resume(token, "end-stepping-range")
+            return None
+        elif cmd == "-exec-finish":
+            self.resume(token, "function-finished")
+            return None
+        elif cmd == "-exec-interrupt":
+            # Never actually running, every resume stops right away
+            pass
+        elif cmd == "-stack-info-frame":
+            return "frame=%s" % self.frame(self.current_thread, self.level)
+        elif cmd == "-stack-info-depth":
+            return 'depth="%d"' % o.frames
+        elif cmd == "-stack-select-frame":
+            self.level = int(args[0])
+        elif cmd == "-stack-list-frames":
+            thread, args = self.thread_option(args)
+            low, high = self.frame_range(args)
+            return "stack=[%s]" % ",".join(["frame=%s" % self.frame(thread, l) for l in range(low, high + 1)])
+        elif cmd == "-stack-list-arguments":
+            thread, args = self.thread_option(args)
+            low, high = self.frame_range(args[1:])
+            values = args[0] not in ("0", "--no-values")
+            frames = []
+            for l in range(low, high + 1):
+                if values:
+                    fields = ",".join(['{name="arg%d",value=%s}' % (i, quote(l * 10 + i + self.stops // 2)) for i in range(2)])
+                else:
+                    fields = ",".join(['name="arg%d"' % i for i in range(2)])
+                frames.append('frame={level="%d",args=[%s]}' % (l, fields))
+            return "stack-args=[%s]" % ",".join(frames)
+        elif cmd == "-stack-list-locals":
+            names = ['name="local%d"' % i for i in range(o.locals)]
+            if o.children > 0:
+                names.append('name="container"')
+            return "locals=[%s]" % ",".join(names)
+        elif cmd == "-thread-info":
+            ids = [int(args[0])] if len(args) > 0 else range(1, o.threads + 1)
+            threads = []
+            for id in ids:
+                threads.append('{id="%d",target-id="Thread 0x%x",frame=%s,state="stopped"}' %
+                               (id, 0x7f0000 + id, self.frame(id, 0)))
+            return 'threads=[%s],current-thread-id="%d"' % (",".join(threads), self.current_thread)
+        elif cmd == "-thread-list-ids":
+            ids = ",".join(['thread-id="%d"' % id for id in range(1, o.threads + 1)])
+            return 'thread-ids={%s},current-thread-id="%d",number-of-threads="%d"' % (ids, self.current_thread, o.threads)
+        elif cmd == "-thread-select":
+            self.current_thread = int(args[0])
+            self.level = 0
+            return 'new-thread-id="%d",frame=%s' % (self.current_thread, self.frame(self.current_thread, 0))
+        elif cmd == "-var-create":
+            exp = args[2]
+            name = self.create_varobj(exp, o.children if exp == "container" else 0)
+            return 'name="%s",%s,has_more="0"' % (name, self.varobj_fields(name))
+        elif cmd == "-var-list-children":
+            parent = args[-1]
+            exp, children = self.varobjs.get(parent, ("", 0))
+            out = []
+            for i in range(children):
+                name = "%s.%d" % (parent, i)
+                self.varobjs[name] = ("[%d]" % i, 0)
+                out.append('child={name="%s",exp="%d",%s}' % (name, i, self.varobj_fields(name)))
+            return 'numchild="%d",children=[%s],has_more="0"' % (children, ",".join(out))
+        elif cmd == "-var-update":
+            changes = []
+            for name in sorted(self.varobjs.keys()):
+                if self.varobjs[name][1] == 0:
+                    changes.append('{name="%s",value=%s,in_scope="true",type_changed="false"}' %
+                                   (name, self.value(self.varobjs[name][0])))
+            return "changelist=[%s]" % ",".join(changes)
+        elif cmd == "-var-evaluate-expression":
+            return "value=%s" % self.value(self.varobjs.get(args[-1], ("",))[0])
+        elif cmd == "-var-assign":
+            return "value=%s" % quote(args[-1])
+        elif cmd == "-var-show-attributes":
+            return 'attr="editable"'
+        elif cmd == "-var-delete":
+            self.varobjs.pop(args[-1], None)
+        elif cmd == "-data-evaluate-expression":
+            if args[0] == "$pc":
+                return 'value="0x%016x <func_0_0+%d>"' % (0x400000 + self.stops * 4, self.stops * 4)
+            return "value=%s" % self.value(args[0])
+        elif cmd == "-data-list-register-names":
+            return "register-names=[%s]" % ",".join(['"r%d"' % i for i in range(o.registers)])
+        elif cmd == "-data-list-register-values":
+            numbers = [int(a) for a in args[1:]] if len(args) > 1 else range(o.registers)
+            values = ['{number="%d",value="0x%x"}' % (i, self.stops * (i + 1)) for i in numbers]
+            return "register-values=[%s]" % ",".join(values)
+        elif cmd == "-data-list-changed-registers":
+            return "changed-registers=[%s]" % ",".join(['"%d"' % i for i in range(0, o.registers, 3)])
+        elif cmd == "-data-disassemble":
+            insns = []
+            for i in range(50):
+                insns.append('{address="0x%016x",func-name="func_0_0",offset="%d",inst="mov $0x%x,%%eax"}' %
+                             (0x400000 + self.stops * 4 + i * 4, i * 4, i))
+            return "asm_insns=[%s]" % ",".join(insns)
+        elif cmd == "-data-read-memory-bytes":
+            addr = int(args[0], 0)
+            length = int(args[1], 0)
+            contents = "".join(["%02x" % ((addr + i + self.stops) & 0xff) for i in range(length)])
+            return 'memory=[{begin="0x%x",offset="0x0",end="0x%x",contents="%s"}]' % (addr, addr + length, contents)
+        elif cmd.startswith("-") and cmd.split("-")[1] in ("break", "gdb", "inferior", "enable",
+                                                          "var", "interpreter", "environment", "trace"):
+            pass
+        else:
+            raise ValueError("Undefined MI command: %s" % cmd[1:])
+        return ""
+
+    def thread_option(self, args):
+        if len(args) > 1 and args[0] == "--thread":
+            return int(args[1]), args[2:]
+        return self.current_thread, args
+
+    def frame_range(self, args):
+        if len(args) >= 2:
+            return int(args[0]), min(int(args[1]), self.options.frames - 1)
+        return 0, self.options.frames - 1
+
+    def run(self):
+        self.output('=thread-group-added,id="i1"')
+        self.prompt()
+        while True:
+            line = sys.stdin.readline()
+            if len(line) == 0:
+                break
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            m = re.match(r"^(\d*)(\S+)\s*(.*)$", line)
+            token, cmd, rest = m.groups()
+            args = [a if a else b for a, b in arguments_regex.findall(rest)]
+            time.sleep(self.options.delay / 1000.0)
+            try:
+                result = self.handle(token, cmd, args)
+                if result != None:
+                    self.output("%s^done%s" % (token, "," + result if len(result) > 0 else ""))
+            except ValueError as e:
+                self.output("%s^error,msg=%s" % (token, quote(e)))
+            self.prompt()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake gdb MI interpreter")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--locals", type=int, default=10)
+    parser.add_argument("--children", type=int, default=1000,
+                        help="elements in the \"container\" local, 0 for none")
+    parser.add_argument("--registers", type=int, default=32)
+    parser.add_argument("--delay", type=float, default=0, help="milliseconds before each reply")
+    parser.add_argument("--run-delay", type=float, default=10, help="milliseconds the program runs for")
+    parser.add_argument("--source", default=os.path.abspath(__file__).replace("\\", "/"),
+                        help="the file frames are reported in")
+    # Whatever gdb would have been given, like --interpreter=mi --args
+    options, ignored = parser.parse_known_args()
+    FakeGdb(options).run()
+
+
+if __name__ == "__main__":
+    main()